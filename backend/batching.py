@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Async micro-batching: coalesce concurrent single-item requests into one batched call.
+Used to merge the per-request embedding (and search) calls made under concurrent load.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within `max_delay` seconds (up to `max_batch_size`) and
+    resolves them with a single `await batch_fn(items)`, which must return one result
+    per item in the same order. An exception from batch_fn is raised in every caller
+    of that batch.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 64,
+        max_delay: float = 0.02,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Batches in flight; held so the tasks aren't garbage collected mid-call
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. tests): queue and worker belong to one loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._collect())
+
+        future = loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self):
+        """Worker loop: gather a batch, hand it off, start on the next one."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already queued without waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Don't block collection of the next batch on this one's network call
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        # Callers that have gone away (e.g. client disconnected) are dropped
+        batch = [(item, fut) for item, fut in batch if not fut.done()]
+        if not batch:
+            return
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
@@ -4,20 +4,63 @@ Multi-modal document parser for RAG system.
 Supports HTML, PDF, TXT files and URLs.
 Extracts text chunks along with associated images and videos.
 """
+import hashlib
 import os
+import pickle
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional
 from urllib.parse import urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 from PIL import Image
 import io
 
+# Image sources that are decorative (bullets, spacers, ...) rather than content
+_ICON_RE = re.compile(r'bullet|icon|spacer|transparent|1x1', re.IGNORECASE)
+_ABSOLUTE_PREFIXES = ('http://', 'https://')
+# Plain relative paths (no scheme, root, dot segments or empty query) that urljoin would
+# resolve to exactly "<base directory>/<src>", so they can be concatenated instead
+_SIMPLE_RELATIVE_RE = re.compile(r'(?!.*(?:\./|/\.|//))[\w\-~%][\w\-~%/.=&?]*(?<![.?])')
+# Whitespace runs collapsed to a single space (one C-level pass, no token list)
+_WS_RE = re.compile(r'\s+')
+# Embedded video hosts; YouTube watch/short links capture the video id for the embed URL
+_VIDEO_RE = re.compile(
+    r'youtube\.com/watch\?(?:[^#]*?&)?v=([\w-]+)|youtu\.be/([\w-]+)|youtube\.com|vimeo\.com'
+)
+
+# Shared session so URL ingests reuse keep-alive connections (and TLS sessions) per host
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.2))
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+
+
+@lru_cache(maxsize=4096)
+def _join_url(base_url: str, src: str) -> str:
+    """urljoin, memoized: the same images recur across pages of one KB."""
+    return urljoin(base_url, src)
+
+
+def content_hash(text: str) -> str:
+    """
+    Identifies chunk text; stored in each Qdrant point's payload as content_hash and used to
+    skip chunks already in the knowledge base (by the API and seed_kb.py --direct alike).
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
 
 class ImageMapping:
     """Represents an image with its context (the text it illustrates)."""
+    __slots__ = ('url', 'context')
+
     def __init__(self, url: str, context: str):
         self.url = url
         self.context = context  # Text that this image illustrates
@@ -28,6 +71,9 @@ class ImageMapping:
 
 class DocumentChunk:
     """Represents a chunk of text with associated media."""
+    # One instance per chunk of every ingested document; skip the per-instance __dict__
+    __slots__ = ('text', 'source', 'image_urls', 'video_urls', 'source_doc', 'image_mappings', '_mapping_dicts')
+
     def __init__(
         self,
         text: str,
@@ -43,38 +89,143 @@ class DocumentChunk:
         self.video_urls = video_urls or []
         self.source_doc = source_doc or source
         self.image_mappings = image_mappings or []  # NEW
+        # Serialized image_mappings, shared by all chunks of a document when set by the parser
+        self._mapping_dicts = None
 
     def to_dict(self) -> Dict[str, Any]:
+        mapping_dicts = self._mapping_dicts
+        if mapping_dicts is None:
+            mapping_dicts = [m.to_dict() for m in self.image_mappings]
         return {
             "text": self.text,
             "source": self.source,
             "image_urls": self.image_urls,
             "video_urls": self.video_urls,
             "source_doc": self.source_doc,
-            "image_mappings": [m.to_dict() for m in self.image_mappings],  # NEW
+            "image_mappings": mapping_dicts,  # NEW
         }
 
 
 class DocumentParser:
     """Multi-modal document parser."""
     
+    # Boilerplate elements stripped from the content subtree before extraction
+    NOISE_SELECTOR = 'script, style, nav, footer, header'
+    # Elements whose text is used as image context
+    TEXT_TAGS = frozenset(['p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'td', 'th', 'span', 'div'])
+    # Everything _extract_from_html looks at: text containers plus media
+    ELEMENT_SELECTOR = ', '.join(sorted(TEXT_TAGS)) + ', img, iframe'
+    # Embedded PDF images smaller than this many pixels (e.g. 20x20) are not extracted
+    MIN_PDF_IMAGE_AREA = 400
+    # Bump when parsing output changes so stale cache entries are ignored
+    CACHE_VERSION = 1
+    # Parse cache entries kept on disk; least recently used (by mtime) are evicted beyond this
+    MAX_CACHE_ENTRIES = 256
+    
     def __init__(self, chunk_size: int = 1000, overlap: int = 200):
         self.chunk_size = chunk_size
         self.overlap = overlap
         self.extracted_media_dir = Path(__file__).parent / "extracted_media"
         self.extracted_media_dir.mkdir(exist_ok=True)
+        self.cache_dir = self.extracted_media_dir / ".cache"
 
-    def parse_document(self, path: str, is_url: bool = False) -> List[DocumentChunk]:
+    def parse_document(self, path: str, is_url: bool = False, use_cache: bool = False) -> List[DocumentChunk]:
         """
         Parse a document and return chunks with media references.
         
         Args:
             path: File path or URL
             is_url: True if path is a URL
+            use_cache: Reuse chunks from a previous parse of identical content
         
         Returns:
             List of DocumentChunk objects
         """
+        cache_key = self._cache_key(path, is_url) if use_cache else None
+        if cache_key:
+            cached = self._load_cached(cache_key)
+            if cached is not None:
+                return cached
+        
+        chunks = list(self.iter_chunks(path, is_url=is_url))
+        if cache_key and chunks:
+            self._store_cached(cache_key, chunks)
+        return chunks
+
+    def _cache_key(self, path: str, is_url: bool) -> Optional[str]:
+        """Content hash identifying a parse result, or None if the source can't be fingerprinted."""
+        digest = hashlib.sha256(f"{self.CACHE_VERSION}|{self.chunk_size}|{self.overlap}|".encode())
+        if is_url:
+            try:
+                response = _SESSION.head(path, timeout=10, allow_redirects=True)
+            except requests.RequestException:
+                return None
+            etag = response.headers.get('ETag', '')
+            last_modified = response.headers.get('Last-Modified', '')
+            if not (etag or last_modified):
+                return None
+            digest.update(f"{path}|{etag}|{last_modified}".encode())
+        else:
+            # Chunk sources embed the file name, so it is part of the key
+            path_obj = Path(path)
+            digest.update(path_obj.name.encode() + b"|")
+            with open(path_obj, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _load_cached(self, cache_key: str) -> Optional[List[DocumentChunk]]:
+        cache_file = self.cache_dir / f"{cache_key}.pkl"
+        try:
+            with open(cache_file, 'rb') as f:
+                chunks = pickle.load(f)
+            # Hits refresh the mtime, which eviction orders by
+            os.utime(cache_file)
+            return chunks
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable parse cache entry {cache_file.name}: {e}")
+            return None
+
+    def _store_cached(self, cache_key: str, chunks: List[DocumentChunk]) -> None:
+        """Best effort: a failed write is logged and the parse result is still returned."""
+        cache_file = self.cache_dir / f"{cache_key}.pkl"
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.cache_dir.mkdir(exist_ok=True)
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+            self._evict_cached()
+        except Exception as e:
+            print(f"Could not write parse cache entry {cache_file.name}: {e}")
+            try:
+                tmp_file.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def _evict_cached(self) -> None:
+        """Delete the least recently used cache entries beyond MAX_CACHE_ENTRIES."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pkl'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        if len(entries) <= self.MAX_CACHE_ENTRIES:
+            return
+        entries.sort()
+        for _, entry_path in entries[:len(entries) - self.MAX_CACHE_ENTRIES]:
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass  # Already evicted by a concurrent store
+
+    def iter_chunks(self, path: str, is_url: bool = False) -> Iterator[DocumentChunk]:
+        """Lazily yield a document's chunks, for callers that stream them onward."""
         if is_url:
             return self._parse_url(path)
         
@@ -90,26 +241,26 @@ class DocumentParser:
         else:
             raise ValueError(f"Unsupported file type: {ext}")
 
-    def _parse_url(self, url: str) -> List[DocumentChunk]:
+    def _parse_url(self, url: str) -> Iterator[DocumentChunk]:
         """Fetch and parse HTML from URL."""
         try:
-            response = requests.get(url, timeout=10)
+            response = _SESSION.get(url, timeout=10)
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            return self._extract_from_html(soup, source_name=url, base_url=url)
+            tree = LexborHTMLParser(response.text)
+            yield from self._extract_from_html(tree, source_name=url, base_url=url)
         except Exception as e:
             print(f"Error fetching URL {url}: {e}")
-            return []
 
-    def _parse_html_file(self, file_path: Path) -> List[DocumentChunk]:
+    def _parse_html_file(self, file_path: Path) -> Iterator[DocumentChunk]:
         """Parse HTML file and extract text chunks with media."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
+        # lexbor parses UTF-8 bytes natively; skip the decode/re-encode round trip
+        with open(file_path, 'rb') as f:
+            tree = LexborHTMLParser(f.read())
         
         # Base URL for relative paths (file's directory)
         base_path = file_path.parent
         return self._extract_from_html(
-            soup, 
+            tree, 
             source_name=f"kb/{file_path.name}",
             base_url=str(base_path),
             is_local=True
@@ -117,87 +268,110 @@ class DocumentParser:
 
     def _extract_from_html(
         self, 
-        soup: BeautifulSoup, 
+        tree: LexborHTMLParser, 
         source_name: str,
         base_url: str = "",
         is_local: bool = False
-    ) -> List[DocumentChunk]:
-        """Extract text chunks and media from BeautifulSoup object with image-text relationships."""
-        # Remove script and style tags
-        for tag in soup(['script', 'style', 'nav', 'footer', 'header']):
-            tag.decompose()
-        
-        chunks = []
+    ) -> Iterator[DocumentChunk]:
+        """Extract text chunks and media from a lexbor HTML tree with image-text relationships."""
+        # Find the main content area first so only its subtree is touched from Python
+        main_content = tree.css_first('div#main-content') or tree.css_first('main') or tree.body or tree.root
         
-        # Find the main content area
-        main_content = soup.find('div', {'id': 'main-content'}) or soup.find('main') or soup.find('body') or soup
+        # Remove script and style tags
+        for node in main_content.css(self.NOISE_SELECTOR):
+            node.decompose()
         
         # Build image mappings by iterating through elements in order
         image_mappings = []
         all_image_urls = []
+        seen_image_urls = set()
+        video_urls = []
         current_text_context = ""
+        # Text elements seen since the last mapped image; their text is only computed
+        # when an image actually needs a context
+        pending_text = []
+        root_id = main_content.mem_id
+        # Directory of the base URL, resolved once for all relative image sources
+        base_prefix = _join_url(base_url, '.') if base_url else ''
         
-        # Iterate through all elements to capture text-image relationships
-        for element in main_content.descendants:
-            if element.name in ['p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'td', 'th', 'span', 'div']:
-                # Get direct text (not from children)
-                text = element.get_text(separator=' ', strip=True)
-                if text and len(text) > 10:
-                    current_text_context = text[:200]  # Keep last 200 chars as context
+        # A single selector query returns every element we inspect, in document order,
+        # instead of walking all descendants from Python
+        for element in main_content.css(self.ELEMENT_SELECTOR):
+            if element.mem_id == root_id:
+                continue
+            tag = element.tag
+            if tag in self.TEXT_TAGS:
+                pending_text.append(element)
             
-            elif element.name == 'img':
-                src = element.get('src', '')
+            elif tag == 'img':
+                attrs = element.attributes
+                src = attrs.get('src') or ''
                 if not src:
                     continue
                 
                 # Skip tiny icons
-                width = element.get('width', '')
-                height = element.get('height', '')
+                width = attrs.get('width') or ''
+                height = attrs.get('height') or ''
                 try:
                     if (width and int(width) < 20) or (height and int(height) < 20):
                         continue
                 except (ValueError, TypeError):
-                    if any(skip in src.lower() for skip in ['bullet', 'icon', 'spacer', 'transparent', '1x1']):
+                    if _ICON_RE.search(src):
                         continue
                 
-                # Build full URL
-                if is_local and not src.startswith(('http://', 'https://', '/')):
+                # Build full URL (absolute sources are the common case and need no joining)
+                if src.startswith(_ABSOLUTE_PREFIXES):
+                    img_url = src
+                elif is_local and not src.startswith('/'):
                     img_url = f"/media/{src}"
-                elif not src.startswith(('http://', 'https://')):
-                    img_url = urljoin(base_url, src)
+                elif _SIMPLE_RELATIVE_RE.fullmatch(src):
+                    img_url = base_prefix + src
                 else:
-                    img_url = src
+                    img_url = _join_url(base_url, src)
                 
                 # Create mapping with context
-                if img_url not in all_image_urls:
+                if img_url not in seen_image_urls:
+                    # Context is the most recent text element with real content (> 10 chars)
+                    while pending_text:
+                        text = pending_text.pop().text(deep=True, separator=' ', strip=True)
+                        if len(text) > 10:
+                            current_text_context = text[:200]  # Keep last 200 chars as context
+                            break
+                    pending_text.clear()
+                    
+                    seen_image_urls.add(img_url)
                     all_image_urls.append(img_url)
                     image_mappings.append(ImageMapping(
                         url=img_url,
                         context=current_text_context
                     ))
-        
-        # Find videos
-        video_urls = []
-        for iframe in main_content.find_all('iframe'):
-            src = iframe.get('src', '')
-            if src and any(x in src for x in ['youtube.com', 'youtu.be', 'vimeo.com']):
-                if 'youtube.com/watch' in src:
-                    video_id = src.split('v=')[1].split('&')[0]
-                    src = f"https://www.youtube.com/embed/{video_id}"
-                elif 'youtu.be/' in src:
-                    video_id = src.split('youtu.be/')[1].split('?')[0]
+            
+            elif tag == 'iframe':
+                # Embedded videos
+                src = element.attributes.get('src') or ''
+                match = _VIDEO_RE.search(src)
+                if not match:
+                    continue
+                video_id = match.group(1) or match.group(2)
+                if video_id:
                     src = f"https://www.youtube.com/embed/{video_id}"
                 video_urls.append(src)
         
         # Get full text and chunk it
-        full_text = main_content.get_text(separator=' ', strip=True)
-        full_text = ' '.join(full_text.split())
+        full_text = main_content.text(separator=' ', strip=True)
+        full_text = _WS_RE.sub(' ', full_text).strip()
         
         if not full_text or len(full_text) < 50:
-            return chunks
+            return
         
         text_chunks = self._chunk_text(full_text)
         
+        # Every chunk carries the same mappings; serialize them once for all of them
+        mapping_dicts = [m.to_dict() for m in image_mappings]
+        # One shared string object for every chunk's source_doc (it also stays shared
+        # when the chunks are pickled back from a worker process or the cache)
+        source_name = sys.intern(source_name)
+        
         # Create chunks with image mappings
         for i, chunk_text in enumerate(text_chunks):
             chunk = DocumentChunk(
@@ -208,143 +382,155 @@ class DocumentParser:
                 source_doc=source_name,
                 image_mappings=image_mappings,  # NEW: Include mappings with context
             )
-            chunks.append(chunk)
-        
-        return chunks
+            chunk._mapping_dicts = mapping_dicts
+            yield chunk
 
-    def _parse_pdf(self, file_path: Path) -> List[DocumentChunk]:
+    def _parse_pdf(self, file_path: Path) -> Iterator[DocumentChunk]:
         """Parse PDF and extract text chunks with embedded images."""
-        chunks = []
-        
+        pdf = None
         try:
             reader = PdfReader(str(file_path))
+            # Text comes from PDFium's C text layer, much faster than PyPDF2's
+            # pure-Python content-stream interpreter; PyPDF2 still walks the XObjects
+            pdf = pdfium.PdfDocument(str(file_path))
             
-            # Extract images from PDF
+            # Single pass over the pages: extract text and embedded images together
             image_urls = []
+            text_parts = []
             for page_num, page in enumerate(reader.pages):
-                if '/XObject' in page['/Resources']:
-                    xObject = page['/Resources']['/XObject'].get_object()
+                pdf_page = pdf[page_num]
+                textpage = pdf_page.get_textpage()
+                text_parts.append(textpage.get_text_range())
+                textpage.close()
+                pdf_page.close()
+                
+                resources = page['/Resources']
+                if '/XObject' not in resources:
+                    continue
+                xObject = resources['/XObject'].get_object()
+                
+                for obj_name in xObject:
+                    obj = xObject[obj_name]
                     
-                    for obj_name in xObject:
-                        obj = xObject[obj_name]
-                        
-                        if obj['/Subtype'] == '/Image':
-                            try:
-                                # Extract image data
-                                size = (obj['/Width'], obj['/Height'])
-                                data = obj.get_data()
-                                
-                                # Save image
-                                img_filename = f"{file_path.stem}_page{page_num}_{obj_name[1:]}.png"
-                                img_path = self.extracted_media_dir / img_filename
-                                
-                                # Try to create PIL image
-                                if obj['/ColorSpace'] == '/DeviceRGB':
-                                    img = Image.frombytes('RGB', size, data)
-                                elif obj['/ColorSpace'] == '/DeviceGray':
-                                    img = Image.frombytes('L', size, data)
-                                else:
-                                    continue
-                                
-                                img.save(img_path)
-                                image_urls.append(f"/media/extracted_media/{img_filename}")
-                            except Exception as e:
-                                print(f"Could not extract image from PDF: {e}")
+                    if obj['/Subtype'] == '/Image':
+                        try:
+                            size = (obj['/Width'], obj['/Height'])
+                            # Skip icons/bullets before paying for decoding the stream
+                            if size[0] * size[1] < self.MIN_PDF_IMAGE_AREA:
                                 continue
+                            
+                            if obj['/ColorSpace'] == '/DeviceRGB':
+                                mode = 'RGB'
+                            elif obj['/ColorSpace'] == '/DeviceGray':
+                                mode = 'L'
+                            else:
+                                continue
+                            
+                            # Extract image data
+                            img = Image.frombytes(mode, size, obj.get_data())
+                            
+                            # Save image
+                            img_filename = f"{file_path.stem}_page{page_num}_{obj_name[1:]}.png"
+                            img_path = self.extracted_media_dir / img_filename
+                            img.save(img_path, optimize=False, compress_level=1)
+                            image_urls.append(f"/media/extracted_media/{img_filename}")
+                        except Exception as e:
+                            print(f"Could not extract image from PDF: {e}")
+                            continue
             
-            # Extract text from all pages
-            full_text = ""
-            for page in reader.pages:
-                full_text += page.extract_text() + "\n\n"
-            
-            full_text = ' '.join(full_text.split())  # Normalize whitespace
+            full_text = "\n\n".join(text_parts)
+            full_text = _WS_RE.sub(' ', full_text).strip()  # Normalize whitespace
             
             # Chunk the text
             text_chunks = self._chunk_text(full_text)
-            
-            # Create chunks with images attached to first chunk
-            for i, chunk_text in enumerate(text_chunks):
-                chunk = DocumentChunk(
-                    text=chunk_text,
-                    source=f"kb/{file_path.name}#page-{i+1}",
-                    image_urls=image_urls if i == 0 else [],
-                    video_urls=[],
-                    source_doc=f"kb/{file_path.name}",
-                )
-                chunks.append(chunk)
+            source_doc = sys.intern(f"kb/{file_path.name}")
         
         except Exception as e:
             print(f"Error parsing PDF {file_path}: {e}")
+            return
+        finally:
+            if pdf is not None:
+                pdf.close()
         
-        return chunks
+        # Create chunks with images attached to first chunk
+        for i, chunk_text in enumerate(text_chunks):
+            yield DocumentChunk(
+                text=chunk_text,
+                source=f"{source_doc}#page-{i+1}",
+                image_urls=image_urls if i == 0 else [],
+                video_urls=[],
+                source_doc=source_doc,
+            )
 
-    def _parse_text(self, file_path: Path) -> List[DocumentChunk]:
+    def _parse_text(self, file_path: Path) -> Iterator[DocumentChunk]:
         """Parse plain text file (backward compatibility)."""
         with open(file_path, 'r', encoding='utf-8') as f:
             text = f.read().strip()
         
-        text = ' '.join(text.split())  # Normalize whitespace
+        text = _WS_RE.sub(' ', text).strip()  # Normalize whitespace
         text_chunks = self._chunk_text(text)
+        source_doc = sys.intern(f"kb/{file_path.name}")
         
-        chunks = []
         for i, chunk_text in enumerate(text_chunks):
-            chunk = DocumentChunk(
+            yield DocumentChunk(
                 text=chunk_text,
-                source=f"kb/{file_path.name}#chunk-{i+1}",
+                source=f"{source_doc}#chunk-{i+1}",
                 image_urls=[],
                 video_urls=[],
-                source_doc=f"kb/{file_path.name}",
+                source_doc=source_doc,
             )
-            chunks.append(chunk)
-        
-        return chunks
 
     def _chunk_text(self, text: str) -> List[str]:
-        """Split text into chunks with overlap."""
+        """Split text into chunks with overlap (window chunk_size, stride chunk_size - overlap)."""
         if not text:
             return []
         
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = min(len(text), start + self.chunk_size)
-            chunk = text[start:end]
-            
-            if chunk.strip():
-                chunks.append(chunk)
-            
-            if end == len(text):
-                break
-            
-            start = max(0, end - self.overlap)
+        size = self.chunk_size
+        if len(text) <= size:
+            return [text] if text.strip() else []
         
-        return chunks
+        step = size - self.overlap
+        # Windows starting at or after len(text) - overlap would sit inside the previous one
+        starts = range(0, max(len(text) - self.overlap, 1), step)
+        return [chunk for chunk in (text[i:i + size] for i in starts) if chunk.strip()]
 
 
 # Convenience functions for external use
-def parse_document(path: str, is_url: bool = False, chunk_size: int = 1000, overlap: int = 200) -> List[DocumentChunk]:
+def parse_document(
+    path: str,
+    is_url: bool = False,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    use_cache: bool = False,
+) -> List[DocumentChunk]:
     """Parse a document and return chunks with media."""
     parser = DocumentParser(chunk_size=chunk_size, overlap=overlap)
-    return parser.parse_document(path, is_url=is_url)
+    return parser.parse_document(path, is_url=is_url, use_cache=use_cache)
 
 
-def parse_directory(directory: Path, extensions: List[str] = None) -> List[DocumentChunk]:
-    """Parse all supported documents in a directory."""
+def parse_directory(
+    directory: Path,
+    extensions: List[str] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = False,
+) -> List[DocumentChunk]:
+    """Parse all supported documents in a directory, one file per worker process."""
     if extensions is None:
         extensions = ['.txt', '.html', '.htm', '.pdf']
     
-    parser = DocumentParser()
+    files = [file_path for ext in extensions for file_path in directory.glob(f"*{ext}")]
     all_chunks = []
     
-    for ext in extensions:
-        for file_path in directory.glob(f"*{ext}"):
+    # Parsing is CPU-bound (lexbor, PyPDF2, PIL), so use processes rather than threads.
+    # Results are collected in submission order so the chunk order is deterministic.
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(parse_document, str(file_path), use_cache=use_cache) for file_path in files]
+        for file_path, future in zip(files, futures):
             try:
-                chunks = parser.parse_document(str(file_path))
+                chunks = future.result()
                 all_chunks.extend(chunks)
                 print(f"✓ Parsed {file_path.name}: {len(chunks)} chunks")
             except Exception as e:
                 print(f"✗ Error parsing {file_path.name}: {e}")
     
     return all_chunks
-
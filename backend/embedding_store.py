@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed store for query embeddings, so the embedding cache survives restarts.
+Vectors are kept as raw float32 bytes (6KB for 1536 dimensions) keyed by sha256(model, text).
+"""
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from sqlite_wal import connect_wal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache(created_at);
+"""
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode()).digest()
+
+
+class EmbeddingStore:
+    """Persistent embedding cache (WAL mode); entries older than max_age_days are ignored and purged."""
+
+    # How often put_many() also purges expired entries
+    PURGE_INTERVAL = 24 * 3600
+
+    def __init__(self, db_path: Path, max_age_days: int = 30):
+        self.db_path = Path(db_path)
+        self.max_age = max_age_days * 24 * 3600
+        self._lock = threading.Lock()
+        self._conn = connect_wal(self.db_path)
+        self._conn.executescript(SCHEMA)
+        self._last_purge = 0.0
+        self.purge()
+
+    def _cutoff(self) -> int:
+        return int(time.time() - self.max_age)
+
+    def get(self, key: bytes) -> Optional[array]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embedding_cache WHERE key = ? AND created_at >= ?", (key, self._cutoff())
+            ).fetchone()
+        if row is None:
+            return None
+        vec = array("f")
+        vec.frombytes(row[0])
+        return vec
+
+    def put_many(self, model: str, entries: Iterable[Tuple[bytes, array]]):
+        now = int(time.time())
+        rows = [(key, model, vec.tobytes(), now) for key, vec in entries]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (key, model, vector, created_at) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if now - self._last_purge >= self.PURGE_INTERVAL:
+            self.purge()
+
+    def recent(self, model: str, limit: int) -> List[Tuple[bytes, array]]:
+        """The `limit` most recently stored live embeddings for `model` (for warming the in-memory cache)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, vector FROM embedding_cache WHERE model = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (model, self._cutoff(), limit),
+            ).fetchall()
+        result = []
+        for key, blob in rows:
+            vec = array("f")
+            vec.frombytes(blob)
+            result.append((key, vec))
+        return result
+
+    def purge(self) -> int:
+        """Delete expired entries; returns how many were removed."""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM embedding_cache WHERE created_at < ?", (self._cutoff(),)).rowcount
+            self._last_purge = time.time()
+        return deleted
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Knowledge-base generation counter, shared by every process through SQLite.
+Whatever changes the knowledge base (/upsert in any worker, seed_kb.py --direct) bumps it;
+each worker compares it with the value it last saw and drops its cached answers when it moved.
+"""
+import threading
+from pathlib import Path
+
+from sqlite_wal import connect_wal
+
+# Default location, shared by the API and seed_kb.py
+KB_GENERATION_DB = Path(__file__).parent / "kb_generation.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kb_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO kb_generation (id, value) VALUES (0, 0);
+"""
+
+
+class KBGeneration:
+    """A single integer in its own SQLite database (WAL mode)."""
+
+    def __init__(self, db_path: Path = KB_GENERATION_DB):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = connect_wal(self.db_path)
+        self._conn.executescript(SCHEMA)
+
+    def get(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM kb_generation WHERE id = 0").fetchone()[0]
+
+    def bump(self) -> int:
+        """Record a knowledge-base change; returns the new generation."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE kb_generation SET value = value + 1 WHERE id = 0 RETURNING value"
+            ).fetchone()[0]
@@ -1,22 +1,36 @@
-import json
+import asyncio
+import hashlib
 import os
 import uuid
 import re
-import shutil
-from datetime import datetime
+import secrets
+import stat
+import threading
+import time
+from array import array
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Set
+from urllib.parse import quote
 
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Form, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as qmodels
-from openai import OpenAI
-from groq import Groq
-from document_parser import DocumentParser, DocumentChunk
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient as OpenAIHttpxClient, RateLimitError as OpenAIRateLimitError
+from groq import AsyncGroq, DefaultAsyncHttpxClient as GroqHttpxClient, RateLimitError as GroqRateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from document_parser import DocumentParser, DocumentChunk, content_hash
+from ticket_store import TicketStore
+from embedding_store import EmbeddingStore, embedding_key
+from batching import MicroBatcher
+from semantic_cache import SemanticCache
+from kb_generation import KBGeneration
 
 load_dotenv()
 
@@ -44,51 +58,171 @@ if VECTOR_SIZE is None:
 if not QDRANT_URL or not QDRANT_API_KEY:
     raise RuntimeError("QDRANT_URL and QDRANT_API_KEY must be set in environment")
 
-client = QdrantClient(
+# gRPC (one multiplexed connection, protobuf instead of JSON) where the Qdrant deployment exposes it
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+
+client = AsyncQdrantClient(
     url=QDRANT_URL,
     api_key=QDRANT_API_KEY,
     timeout=60,
+    prefer_grpc=QDRANT_PREFER_GRPC,
+    grpc_port=QDRANT_GRPC_PORT,
+)
+
+# int8 scalar quantization: vectors are searched as int8 in RAM (4x smaller than float32)
+# and the top candidates are rescored against the original vectors
+QUANTIZATION_CONFIG = qmodels.ScalarQuantization(
+    scalar=qmodels.ScalarQuantizationConfig(
+        type=qmodels.ScalarType.INT8,
+        quantile=0.99,
+        always_ram=True,
+    ),
+)
+SEARCH_PARAMS = qmodels.SearchParams(
+    quantization=qmodels.QuantizationSearchParams(rescore=True, oversampling=2.0),
 )
 
 # Ensure collection exists with cosine distance
-def ensure_collection():
-    try:
-        client.get_collection(QDRANT_COLLECTION)
-    except Exception:
-        client.recreate_collection(
+TEXT_INDEX_PARAMS = qmodels.TextIndexParams(
+    type="text",
+    tokenizer=qmodels.TokenizerType.WORD,
+    min_token_len=2,
+    max_token_len=20,
+    lowercase=True,
+)
+
+# Payload indexes: full-text on "text" for keyword search, exact-match on "content_hash" for
+# de-duplicating uploaded chunks
+PAYLOAD_INDEXES = {
+    "text": TEXT_INDEX_PARAMS,
+    "content_hash": qmodels.PayloadSchemaType.KEYWORD,
+}
+
+
+async def ensure_collection():
+    if not await client.collection_exists(QDRANT_COLLECTION):
+        await client.create_collection(
             collection_name=QDRANT_COLLECTION,
             vectors_config=qmodels.VectorParams(
                 size=VECTOR_SIZE,
                 distance=qmodels.Distance.COSINE,
             ),
+            quantization_config=QUANTIZATION_CONFIG,
         )
+        payload_schema = {}
+    else:
+        info = await client.get_collection(QDRANT_COLLECTION)
+        # Collections created before quantization was enabled get it added in place
+        if info.config.quantization_config is None:
+            await client.update_collection(
+                collection_name=QDRANT_COLLECTION,
+                quantization_config=QUANTIZATION_CONFIG,
+            )
+        payload_schema = info.payload_schema or {}
     
-    # Create payload index for text field to enable keyword search
+    # Create the payload indexes that are missing
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name in payload_schema:
+            continue
+        try:
+            await client.create_payload_index(
+                collection_name=QDRANT_COLLECTION,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+        except Exception:
+            pass # Another worker may have created it meanwhile
+
+
+# The collection check runs lazily on the first request that needs Qdrant, once per process,
+# so workers boot fast and a briefly unavailable Qdrant doesn't stop the app from starting
+_collection_ready = False
+_collection_lock = asyncio.Lock()
+
+# Marks a collection already checked by an earlier process, so restarts skip the Qdrant
+# round-trips; reset_collection.py deletes it
+COLLECTION_SENTINEL = Path(os.getenv("QDRANT_COLLECTION_SENTINEL", "/tmp/qdrant_collection_ready"))
+COLLECTION_SENTINEL_VALUE = f"{QDRANT_URL} {QDRANT_COLLECTION} {VECTOR_SIZE} {','.join(PAYLOAD_INDEXES)}"
+
+
+def _collection_sentinel_matches() -> bool:
     try:
-        client.create_payload_index(
-            collection_name=QDRANT_COLLECTION,
-            field_name="text",
-            field_schema=qmodels.TextIndexParams(
-                type="text",
-                tokenizer=qmodels.TokenizerType.WORD,
-                min_token_len=2,
-                max_token_len=20,
-                lowercase=True,
-            ),
-        )
-    except Exception:
-        pass # Index might already exist
+        return COLLECTION_SENTINEL.read_text() == COLLECTION_SENTINEL_VALUE
+    except OSError:
+        return False
+
+
+async def ensure_collection_ready():
+    global _collection_ready
+    if _collection_ready:
+        return
+    async with _collection_lock:
+        if not _collection_ready:
+            if not _collection_sentinel_matches():
+                await ensure_collection()
+                try:
+                    COLLECTION_SENTINEL.write_text(COLLECTION_SENTINEL_VALUE)
+                except OSError:
+                    pass
+            _collection_ready = True
 
-ensure_collection()
+# Async clients so requests waiting on OpenAI/Groq/Qdrant don't tie up worker threads.
+# HTTP/2 with a larger keep-alive pool: concurrent requests share warm TLS connections
+# instead of opening (and handshaking) new ones.
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
 
 # OpenAI client for embeddings
-oa = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+oa = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=OpenAIHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=60),
+) if OPENAI_API_KEY else None
 
 # Groq client for chat completions
-groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+groq_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    http_client=GroqHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=60),
+) if GROQ_API_KEY else None
+
+# Cap concurrent outbound calls so request bursts queue here instead of tripping 429s
+EMB_SEM = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "20")))
+CHAT_SEM = asyncio.Semaphore(int(os.getenv("GROQ_MAX_CONCURRENCY", "20")))
+
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+
+def _rate_limit_wait(retry_state) -> float:
+    """Wait for the server's retry-after when it sends one, else exponential backoff with jitter."""
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(float(retry_after), 30.0)
+    except ValueError:
+        pass
+    return _backoff(retry_state)
+
+
+# Retry rate-limited (429) OpenAI/Groq calls; other errors surface immediately
+rate_limit_retry = retry(
+    retry=retry_if_exception_type((OpenAIRateLimitError, GroqRateLimitError)),
+    wait=_rate_limit_wait,
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
 
-# Ticket storage
+
+@rate_limit_retry
+async def create_chat_completion(**kwargs):
+    """Groq chat completion (GROQ_MODEL) under the concurrency cap, retried on 429."""
+    async with CHAT_SEM:
+        return await groq_client.chat.completions.create(model=GROQ_MODEL, **kwargs)
+
+# Ticket storage (SQLite; tickets.json is only read once to migrate existing data)
 TICKETS_FILE = Path(__file__).parent / "tickets.json"
+TICKETS_DB = Path(__file__).parent / "tickets.db"
+ticket_store = TicketStore(TICKETS_DB, legacy_json=TICKETS_FILE)
 
 # File upload storage
 UPLOADS_DIR = Path(__file__).parent / "uploads"
@@ -97,75 +231,254 @@ UPLOADS_DIR.mkdir(exist_ok=True)
 # Allowed file types and max size
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Uploads are streamed to disk in 64KB pieces
+# Whole /upload-attachment request body (all files plus form fields); larger requests get 413 up front
+MAX_UPLOAD_REQUEST_SIZE = int(os.getenv("MAX_UPLOAD_REQUEST_SIZE", str(10 * MAX_FILE_SIZE)))
+
+# Uploaded attachments are effectively immutable, let browsers keep them for a day
+FILES_CACHE_CONTROL = "private, max-age=86400"
+# When running behind nginx, set to its internal location aliasing uploads/ (e.g. /_protected/)
+# so /files responses hand the transfer to nginx via X-Accel-Redirect (see START_SERVERS.md)
+FILES_ACCEL_REDIRECT_PREFIX = os.getenv("FILES_ACCEL_REDIRECT_PREFIX")
+# Knowledge base media can be replaced under the same name (re-uploaded documents), so browsers
+# keep it for a day and then revalidate against the ETag (a 304 unless the file changed)
+MEDIA_CACHE_CONTROL = "public, max-age=86400"
+# Content types for the files /files and /media serve, so FileResponse doesn't guess them per
+# request (mimetypes.guess_type); other suffixes still fall back to guessing
+MEDIA_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".txt": "text/plain",
+}
+# /files paths are relative to the backend directory and must stay under uploads/; both are
+# resolved once so requests only need a lexical check
+BACKEND_ROOT = str(Path(__file__).parent.resolve())
+UPLOADS_ROOT = os.path.join(BACKEND_ROOT, "uploads")
+
+
+def regular_file_stat(path) -> Optional[os.stat_result]:
+    """os.stat() of path if it is a regular file, else None (one syscall for both checks)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this version of the file."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
+# Filename sanitizing pattern, compiled once: runs of unsafe characters and/or underscores; each run becomes a single underscore
+_UNSAFE_FILENAME_RUN_RE = re.compile(r'(?:[^\w\-.]|_)+')
 
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename by removing special characters"""
     # Remove path components
     filename = os.path.basename(filename)
-    # Replace spaces and special chars with underscores
-    filename = re.sub(r'[^\w\-_\.]', '_', filename)
-    # Remove multiple underscores
-    filename = re.sub(r'_+', '_', filename)
-    return filename
+    # Replace spaces and special chars with underscores, collapsing repeats, in one pass
+    return _UNSAFE_FILENAME_RUN_RE.sub('_', filename)
+
+
+def copy_upload(src, dest: Path, max_size: int) -> bool:
+    """
+    Copy an uploaded file object to dest in UPLOAD_CHUNK_SIZE pieces (blocking; run it in a thread).
+    Returns False, leaving no file behind, if the upload is larger than max_size.
+    """
+    total = 0
+    with open(dest, "wb") as out:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_size:
+                break
+            out.write(chunk)
+    if total > max_size:
+        dest.unlink(missing_ok=True)
+        return False
+    return True
+
+
+# Current UTC time as ISO-8601 text, formatted at most once per second
+_now_cache = (0, "")
+
+
+def now_iso() -> str:
+    """UTC timestamp (YYYY-MM-DDTHH:MM:SS) for created_at and similar fields"""
+    global _now_cache
+    second = int(time.time())
+    cached_second, formatted = _now_cache
+    if second != cached_second:
+        formatted = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _now_cache = (second, formatted)
+    return formatted
+
+
+# Upload directories already created by this process (skips the mkdir syscalls on repeat uploads)
+_CREATED_DIRS: Set[Path] = set()
+_CREATED_DIRS_LOCK = threading.Lock()
 
 
 def get_upload_path(user_id: str, ticket_id: str) -> Path:
     """Generate upload path: uploads/{date}/{user_id}/{ticket_id}/"""
-    date_str = datetime.utcnow().strftime("%Y-%m-%d")
+    date_str = now_iso()[:10]
     upload_path = UPLOADS_DIR / date_str / user_id / ticket_id
+    if upload_path in _CREATED_DIRS:
+        return upload_path
     upload_path.mkdir(parents=True, exist_ok=True)
+    with _CREATED_DIRS_LOCK:
+        _CREATED_DIRS.add(upload_path)
     return upload_path
 
-def load_tickets():
-    if TICKETS_FILE.exists():
-        with open(TICKETS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def get_next_ticket_number():
-    """Generate next sequential ticket number (TKT-0001, TKT-0002, etc.)"""
-    tickets = load_tickets()
-    # Find the highest ticket number
-    max_number = 0
-    for ticket in tickets:
-        ticket_number = ticket.get("ticket_number", "")
-        if ticket_number and ticket_number.startswith("TKT-"):
-            try:
-                num = int(ticket_number.split("-")[1])
-                max_number = max(max_number, num)
-            except (ValueError, IndexError):
-                pass
-    # Return next number
-    next_number = max_number + 1
-    return f"TKT-{next_number:04d}"
+def save_numbered_ticket(ticket):
+    """Assign the next sequential ticket number (TKT-0001, TKT-0002, etc.) and save the ticket"""
+    # Persistent counter in the ticket database (seeded from the highest existing number),
+    # incremented in the same transaction as the insert
+    return ticket_store.insert_numbered(ticket, "TKT-{:04d}")
 
 def save_ticket(ticket):
-    tickets = load_tickets()
-    tickets.append(ticket)
-    with open(TICKETS_FILE, "w", encoding="utf-8") as f:
-        json.dump(tickets, f, indent=2, ensure_ascii=False)
-    return ticket
+    return ticket_store.insert(ticket)
+
+# Log writes running in the background; held so the tasks aren't garbage collected mid-write
+_pending_saves: Set[asyncio.Task] = set()
+
+def save_ticket_in_background(ticket):
+    """Schedule save_ticket on a worker thread without waiting for it (for Q&A logs)."""
+    task = asyncio.create_task(asyncio.to_thread(save_ticket, ticket))
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
 
 def update_ticket_feedback(ticket_id: str, feedback: str, rating: Optional[int] = None):
-    tickets = load_tickets()
-    for ticket in tickets:
-        if ticket.get("id") == ticket_id:
-            ticket["feedback"] = feedback
-            if rating is not None:
-                ticket["rating"] = rating
-            ticket["feedback_at"] = datetime.utcnow().isoformat()
-            with open(TICKETS_FILE, "w", encoding="utf-8") as f:
-                json.dump(tickets, f, indent=2, ensure_ascii=False)
-            return ticket
-    raise HTTPException(status_code=404, detail="Ticket not found")
-
-
-def get_embeddings(texts: List[str]) -> List[List[float]]:
+    fields = {"feedback": feedback}
+    if rating is not None:
+        fields["rating"] = rating
+    fields["feedback_at"] = now_iso()
+    ticket = ticket_store.set_fields(ticket_id, fields)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
+
+# Large embedding jobs (e.g. document uploads) are split into requests of EMBED_BATCH_SIZE
+# inputs, at most EMBED_PARALLEL_BATCHES of them in flight per call
+EMBED_BATCH_SIZE = 128
+EMBED_PARALLEL_BATCHES = 5
+
+
+async def get_embeddings(texts: List[str]) -> List[List[float]]:
     if oa is None:
         raise HTTPException(status_code=400, detail="OPENAI_API_KEY not set; embeddings not available.")
-    resp = oa.embeddings.create(model=OPENAI_EMBED_MODEL, input=texts)
-    return [d.embedding for d in resp.data]
+    if len(texts) <= EMBED_BATCH_SIZE:
+        resp = await _create_embeddings(texts)
+        return [d.embedding for d in resp.data]
+
+    limiter = asyncio.Semaphore(EMBED_PARALLEL_BATCHES)
+
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        async with limiter:
+            resp = await _create_embeddings(batch)
+        return [d.embedding for d in resp.data]
+
+    # gather() returns the batches in input order
+    batches = await asyncio.gather(*(
+        embed_batch(texts[i:i + EMBED_BATCH_SIZE]) for i in range(0, len(texts), EMBED_BATCH_SIZE)
+    ))
+    return [vec for batch in batches for vec in batch]
+
+
+@rate_limit_retry
+async def _create_embeddings(texts: List[str]):
+    async with EMB_SEM:
+        return await oa.embeddings.create(model=OPENAI_EMBED_MODEL, input=texts)
+
+
+# Query embeddings keyed by embedding_key(model, text). Stored as float32 arrays (~6KB per entry
+# instead of ~50KB for a list of Python floats); Qdrant keeps float32 vectors anyway.
+EMBEDDING_CACHE = TTLCache(maxsize=2048, ttl=3600)
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+# Second tier that survives restarts (30 days). Its own database file: writes from another
+# connection to tickets.db would invalidate TicketStore's query cache.
+EMBEDDINGS_DB = Path(__file__).parent / "embeddings.db"
+embedding_store = EmbeddingStore(EMBEDDINGS_DB, max_age_days=30)
+
+
+def _warm_embedding_cache():
+    """Load the most recently stored embeddings into memory (oldest first, so the newest are evicted last)"""
+    for key, vec in reversed(embedding_store.recent(OPENAI_EMBED_MODEL, EMBEDDING_CACHE.maxsize)):
+        EMBEDDING_CACHE[key] = vec
+
+
+_warm_embedding_cache()
+
+
+def _store_embeddings(entries):
+    """Best effort: the disk tier is only a cache, so a failed write (locked database, full disk) is logged."""
+    try:
+        embedding_store.put_many(OPENAI_EMBED_MODEL, entries)
+    except Exception as e:
+        print(f"Could not persist {len(entries)} query embeddings: {e}")
+
+
+# Embedding-store writes running in the background; held so the tasks aren't garbage collected mid-write
+_pending_embedding_writes: Set[asyncio.Task] = set()
+
+
+async def _embed_queries(texts: List[str]) -> List[List[float]]:
+    """Embed a batch of query texts and remember the results (in memory, and on disk in the background)"""
+    embeddings = await get_embeddings(texts)
+    entries = [(embedding_key(OPENAI_EMBED_MODEL, text), array("f", emb)) for text, emb in zip(texts, embeddings)]
+    with _embedding_cache_lock:
+        EMBEDDING_CACHE.update(entries)
+    # Runs after the batch's callers have their embeddings
+    task = asyncio.create_task(asyncio.to_thread(_store_embeddings, entries))
+    _pending_embedding_writes.add(task)
+    task.add_done_callback(_pending_embedding_writes.discard)
+    return embeddings
+
+
+# Concurrent query embeddings arriving within 20ms share one embeddings.create call
+embedding_batcher = MicroBatcher(_embed_queries, max_batch_size=64, max_delay=0.02)
+
+
+async def get_query_embedding(text: str) -> List[float]:
+    """Embedding for a search query: from memory, else from disk, else via the batched OpenAI call"""
+    key = embedding_key(OPENAI_EMBED_MODEL, text)
+    with _embedding_cache_lock:
+        cached = EMBEDDING_CACHE.get(key)
+    if cached is None:
+        cached = await asyncio.to_thread(embedding_store.get, key)
+        if cached is not None:
+            with _embedding_cache_lock:
+                EMBEDDING_CACHE[key] = cached
+                _embedding_cache_stats["disk_hits"] += 1
+    else:
+        with _embedding_cache_lock:
+            _embedding_cache_stats["hits"] += 1
+    if cached is not None:
+        return cached.tolist()
+    with _embedding_cache_lock:
+        _embedding_cache_stats["misses"] += 1
+    return await embedding_batcher.submit(text)
 
 
 class UpsertItem(BaseModel):
@@ -218,20 +531,24 @@ class CreateTicketRequest(BaseModel):
     ticket_id: Optional[str] = None  # Optional: if provided, use this ID (for file upload coordination)
 
 
-def search_hybrid(question: str, top_k: int = 5):
-    """Hybrid search combining Vector (Semantic) and Keyword (Text Match)"""
-    # 1. Vector Search
-    q_emb = get_embeddings([question])[0]
-    vector_res = client.search(
-        collection_name=QDRANT_COLLECTION,
-        query_vector=q_emb,
-        limit=max(1, min(top_k, 20)),
-        with_payload=True,
-    )
-    
-    # 2. Keyword Search (Text Match)
+async def _search_batch(queries):
+    """Run several (vector, limit) searches in one Qdrant search_batch request"""
+    requests = [
+        qmodels.SearchRequest(vector=vector, limit=limit, with_payload=True, params=SEARCH_PARAMS)
+        for vector, limit in queries
+    ]
+    return await client.search_batch(collection_name=QDRANT_COLLECTION, requests=requests)
+
+
+# Concurrent vector searches share one search_batch round trip. The window is shorter
+# than the embedding batcher's since queries arrive here already grouped by it.
+search_batcher = MicroBatcher(_search_batch, max_batch_size=32, max_delay=0.01)
+
+
+async def keyword_search(question: str, top_k: int = 5):
+    """Payload text match for the question; [] if the text index is unavailable"""
     try:
-        keyword_res = client.scroll(
+        return (await client.scroll(
             collection_name=QDRANT_COLLECTION,
             scroll_filter=qmodels.Filter(
                 must=[
@@ -243,31 +560,98 @@ def search_hybrid(question: str, top_k: int = 5):
             ),
             limit=max(1, min(top_k, 10)),
             with_payload=True,
-        )[0]
+        ))[0]
     except Exception:
-        keyword_res = []
+        return []
+
+
+# Vector top score above which search_hybrid skips the keyword results
+KEYWORD_SKIP_SCORE = float(os.getenv("KEYWORD_SKIP_SCORE", "0.90"))
+
+
+def start_keyword_search(question: str, top_k: int = 5) -> asyncio.Task:
+    """
+    Run keyword_search as a task. It only needs the question, so endpoints start it before
+    computing the query embedding and hand it to search_hybrid; the caller cancels it if
+    the search isn't needed after all (e.g. a semantic cache hit).
+    """
+    async def run():
+        await ensure_collection_ready()
+        return await keyword_search(question, top_k)
+    return asyncio.create_task(run())
+
+
+async def search_hybrid(
+    question: str,
+    top_k: int = 5,
+    q_emb: Optional[List[float]] = None,
+    keyword_task: Optional[asyncio.Task] = None,
+):
+    """
+    Hybrid search combining Vector (Semantic) and Keyword (Text Match); returns [{"id", "score", "payload"}].
+    keyword_task is a start_keyword_search() task for the same question, if the caller already started one.
+    """
+    # 2. Keyword Search (Text Match) overlaps with the embedding call and the vector search
+    if keyword_task is None:
+        keyword_task = start_keyword_search(question, top_k)
+    # 1. Vector Search
+    vector_limit = max(1, min(top_k, 20))
+    try:
+        await ensure_collection_ready()
+        if q_emb is None:
+            q_emb = await get_query_embedding(question)
+        vector_res = await search_batcher.submit((q_emb, vector_limit))
+    except BaseException:
+        keyword_task.cancel()
+        raise
+
+    # Plain dicts with just the fields callers read ({"id", "score", "payload"})
+    combined = [{"id": pt.id, "score": pt.score, "payload": pt.payload} for pt in vector_res]
+    # A full page of vector hits led by a very close match: keyword hits (fixed 0.85 score)
+    # wouldn't add anything useful, so don't wait for them
+    if len(vector_res) >= vector_limit and vector_res[0].score >= KEYWORD_SKIP_SCORE:
+        keyword_task.cancel()
+        return combined
+    keyword_res = await keyword_task
 
     # 3. Combine
-    combined = list(vector_res)
-    existing_ids = {pt.id for pt in combined}
+    existing_ids = {hit["id"] for hit in combined}
     
     for pt in keyword_res:
         if pt.id not in existing_ids:
-            # Convert Record to ScoredPoint
-            scored_pt = qmodels.ScoredPoint(
-                id=pt.id,
-                version=pt.version,
-                score=0.85, # Boost score for keyword match
-                payload=pt.payload,
-                vector=None
-            )
-            combined.append(scored_pt)
+            combined.append({"id": pt.id, "score": 0.85, "payload": pt.payload})  # Boost score for keyword match
             existing_ids.add(pt.id)
             
     return combined
 
 
-app = FastAPI()
+# Endpoint results are encoded with orjson rather than the stdlib json module
+app = FastAPI(default_response_class=ORJSONResponse)
+
+class UploadSizeLimitMiddleware:
+    """Reject requests to the given paths whose Content-Length exceeds max_bytes, before the body is read"""
+
+    def __init__(self, app, paths, max_bytes: int):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        response = JSONResponse(
+                            status_code=413,
+                            content={"detail": f"Upload exceeds maximum request size of {self.max_bytes / (1024*1024)}MB"},
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware, paths={"/upload-attachment"}, max_bytes=MAX_UPLOAD_REQUEST_SIZE)
 
 app.add_middleware(
     CORSMiddleware,
@@ -283,73 +667,216 @@ def health():
     return {"ok": True}
 
 
+@app.get("/embeddings/cache-stats")
+def embedding_cache_stats():
+    """Hit rate and size of the query embedding cache (hits = memory, disk_hits = embeddings.db)"""
+    with _embedding_cache_lock:
+        hits = _embedding_cache_stats["hits"]
+        disk_hits = _embedding_cache_stats["disk_hits"]
+        misses = _embedding_cache_stats["misses"]
+        size = len(EMBEDDING_CACHE)
+    lookups = hits + disk_hits + misses
+    return {
+        "hits": hits,
+        "disk_hits": disk_hits,
+        "misses": misses,
+        "hit_rate": round((hits + disk_hits) / lookups, 4) if lookups else None,
+        "size": size,
+        "maxsize": EMBEDDING_CACHE.maxsize,
+        "ttl_seconds": EMBEDDING_CACHE.ttl,
+    }
+
+
+# Large uploads are embedded and written in batches (one embeddings request and one Qdrant
+# upsert each), UPSERT_PARALLEL_BATCHES of them in flight at a time
+UPSERT_BATCH_SIZE = EMBED_BATCH_SIZE
+UPSERT_PARALLEL_BATCHES = 4
+
+
+def _point_from_item(item: UpsertItem, vec: List[float]) -> qmodels.PointStruct:
+    pid = item.id or str(uuid.uuid4())
+    payload = {"text": item.text, "content_hash": content_hash(item.text)}
+    if item.source:
+        payload["source"] = item.source
+    
+    # Add multi-modal metadata
+    if item.metadata:
+        payload["image_urls"] = item.metadata.get("image_urls", [])
+        payload["video_urls"] = item.metadata.get("video_urls", [])
+        payload["source_doc"] = item.metadata.get("source_doc", item.source)
+        payload["image_mappings"] = item.metadata.get("image_mappings", [])  # NEW: Images with context
+    else:
+        payload["image_urls"] = []
+        payload["video_urls"] = []
+        payload["source_doc"] = item.source
+        payload["image_mappings"] = []
+    
+    return qmodels.PointStruct(
+        id=pid,
+        vector=vec,
+        payload=payload,
+    )
+
+
 @app.post("/upsert")
-def upsert(req: UpsertRequest):
-    texts = [it.text for it in req.items]
-    embeddings = get_embeddings(texts)
-
-    points = []
-    for item, vec in zip(req.items, embeddings):
-        pid = item.id or str(uuid.uuid4())
-        payload = {"text": item.text}
-        if item.source:
-            payload["source"] = item.source
-        
-        # Add multi-modal metadata
-        if item.metadata:
-            payload["image_urls"] = item.metadata.get("image_urls", [])
-            payload["video_urls"] = item.metadata.get("video_urls", [])
-            payload["source_doc"] = item.metadata.get("source_doc", item.source)
-            payload["image_mappings"] = item.metadata.get("image_mappings", [])  # NEW: Images with context
-        else:
-            payload["image_urls"] = []
-            payload["video_urls"] = []
-            payload["source_doc"] = item.source
-            payload["image_mappings"] = []
-        
-        points.append(
-            qmodels.PointStruct(
-                id=pid,
-                vector=vec,
-                payload=payload,
+async def upsert(req: UpsertRequest):
+    await ensure_collection_ready()
+    limiter = asyncio.Semaphore(UPSERT_PARALLEL_BATCHES)
+
+    async def upsert_batch(items: List[UpsertItem]):
+        async with limiter:
+            embeddings = await get_embeddings([it.text for it in items])
+            await client.upsert(
+                collection_name=QDRANT_COLLECTION,
+                points=[_point_from_item(item, vec) for item, vec in zip(items, embeddings)],
+                wait=True,
             )
-        )
 
-    client.upsert(
-        collection_name=QDRANT_COLLECTION,
-        points=points,
-        wait=True,
-    )
-    return {"upserted": len(points)}
+    # Batches overlap: while one waits on Qdrant, the next ones are being embedded
+    batches = [
+        asyncio.create_task(upsert_batch(req.items[start:start + UPSERT_BATCH_SIZE]))
+        for start in range(0, len(req.items), UPSERT_BATCH_SIZE)
+    ]
+    try:
+        await asyncio.gather(*batches)
+    except BaseException:
+        for task in batches:
+            task.cancel()
+        raise
+    # New knowledge base content can change answers (in every worker)
+    invalidate_answer_caches()
+    return {"upserted": len(req.items)}
+
+
+# System prompts are constant; the message dicts are built once and shared by every request
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for DrCloudEHR Support. "
+    "Answer using the provided context. "
+    "\n\nFORMATTING RULES:"
+    "\n- For procedures, use NUMBERED STEPS (1. 2. 3.)"
+    "\n- Each step on its OWN LINE"
+    "\n- For lists, use bullet points (•)"
+    "\n- Keep steps clear and concise"
+    "\n- Do NOT add any citations or references"
+    "\n\nIf not in context, say you don't know."
+)
+STREAM_SYSTEM_PROMPT = (
+    "You are a helpful assistant for DrCloudEHR Support. "
+    "Answer using the provided context. "
+    "\n\nFORMATTING RULES:"
+    "\n- For procedures, use NUMBERED STEPS (1. 2. 3.)"
+    "\n- Each step on its OWN LINE"
+    "\n- For lists, use bullet points (•)"
+    "\n- Keep steps clear and concise"
+    "\n- Do NOT add any citations or references"
+    "\n\nExample:"
+    "\nTo submit DARTS records:"
+    "\n1. Navigate to Patient Summary Chart"
+    "\n2. Click on the DARTS tab"
+    "\n3. Select records to submit"
+    "\n4. Click the Submit button"
+    "\n\nIf not in context, say you don't know."
+)
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+STREAM_SYSTEM_MESSAGE = {"role": "system", "content": STREAM_SYSTEM_PROMPT}
 
 
-@app.post("/ask")
-def ask(
-    req: AskRequest,
-    x_user_id: Optional[str] = Header(None, alias="X-User-ID"),
-    x_site_id: Optional[str] = Header(None, alias="X-Site-ID"),
-    x_tags: Optional[str] = Header(None, alias="X-Tags"),  # Comma-separated
-):
-    if not req.question.strip():
-        raise HTTPException(status_code=400, detail="Question is empty.")
+# Answers for repeated /ask questions, keyed by answer_cache_key()
+ANSWER_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+# Answers for rephrasings of recent questions (cosine similarity of the query embeddings).
+# Only used for questions without conversation history, whose answer depends on the question alone.
+semantic_cache = SemanticCache(
+    dim=VECTOR_SIZE,
+    capacity=512,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93")),
+    ttl=7 * 24 * 3600,
+)
+
+# Both answer caches are per process; the knowledge-base generation is shared, so a change made
+# through any worker (or seed_kb.py --direct) clears them everywhere
+kb_generation = KBGeneration()
+_kb_generation_seen = kb_generation.get()
+
+
+def sync_answer_caches():
+    """Drop this worker's cached answers if the knowledge base changed since it last looked (before cache lookups)"""
+    global _kb_generation_seen
+    current = kb_generation.get()
+    if current != _kb_generation_seen:
+        _kb_generation_seen = current
+        ANSWER_CACHE.clear()
+        semantic_cache.clear()
+
+
+def invalidate_answer_caches():
+    """After a knowledge-base change: clear this worker's answer caches and signal the others"""
+    global _kb_generation_seen
+    _kb_generation_seen = kb_generation.bump()
+    ANSWER_CACHE.clear()
+    semantic_cache.clear()
+def sse(event: dict) -> bytes:
+    """One Server-Sent Events frame carrying `event` as JSON"""
+    # Non-string keys: source_images is keyed by chunk index
+    return b"data: " + orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+# Splits a cached answer into word-sized pieces to replay it as stream tokens
+_STREAM_PIECE_RE = re.compile(r'\s*\S+\s*|\s+')
 
-    # Capture user context from headers or request body (headers take precedence)
-    user_id = x_user_id or req.user_id
-    site_id = x_site_id or req.site_id
-    tags = req.tags or (x_tags.split(",") if x_tags else [])
-    tags = [tag.strip() for tag in tags if tag.strip()]  # Clean up tags
 
-    # Hybrid Search
-    search_res = search_hybrid(req.question, req.top_k)
+@app.get("/semantic-cache/stats")
+def semantic_cache_stats():
+    """Hit rate and size of the near-duplicate question cache"""
+    return semantic_cache.stats()
 
+
+def answer_cache_key(req: AskRequest) -> str:
+    """Hash of everything that determines an /ask answer: normalized question, options and history."""
+    history = [(m.role, m.content) for m in (req.conversation_history or [])]
+    normalized = " ".join(req.question.lower().split())
+    material = orjson.dumps([normalized, req.top_k, req.use_llm, history])
+    return hashlib.sha256(material).hexdigest()
+
+
+# Conversation turns forwarded to the LLM; older turns cost tokens and latency for little benefit
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", "6"))
+
+
+def history_messages(history: Optional[List[ConversationMessage]]) -> List[dict]:
+    """Chat messages for the last MAX_HISTORY user/assistant turns (client-sent system messages are dropped)"""
+    turns = [{"role": msg.role, "content": msg.content} for msg in (history or []) if msg.role in ("user", "assistant")]
+    if len(turns) > MAX_HISTORY:
+        print(f"Truncated conversation history from {len(turns)} to {MAX_HISTORY} messages")
+        turns = turns[-MAX_HISTORY:] if MAX_HISTORY > 0 else []
+    return turns
+
+
+class RetrievalResults:
+    """Contexts, sources and deduplicated media assembled from hybrid search hits."""
+    __slots__ = ('contexts', 'sources', 'images', 'videos', 'chunk_images', 'image_mappings')
+
+    def __init__(self, contexts, sources, images, videos, chunk_images, image_mappings):
+        self.contexts = contexts
+        self.sources = sources
+        self.images = images
+        self.videos = videos
+        self.chunk_images = chunk_images  # Map context index to its images
+        self.image_mappings = image_mappings  # Images with context for smart matching
+
+
+def assemble_results(search_res) -> RetrievalResults:
+    """Shared by /ask and /ask/stream: hits without text are skipped, media is deduplicated by URL."""
     contexts = []
     sources = []
-    all_images = []
-    all_videos = []
-    all_image_mappings = []  # Images with context for smart matching
+    # Unique media, keyed by URL (dicts keep first-seen order)
+    images = {}
+    videos = {}
+    chunk_images = {}
+    image_mappings_by_url = {}
     
-    for pt in search_res:
-        payload = pt.payload or {}
+    for hit in search_res:
+        payload = hit["payload"] or {}
         text = payload.get("text") or ""
         source = payload.get("source") or "unknown"
         image_urls = payload.get("image_urls", [])
@@ -358,63 +885,112 @@ def ask(
         
         if text:
             contexts.append(text)
-            sources.append({"source": source, "score": float(pt.score)})
+            sources.append({"source": source, "score": float(hit["score"])})
+            
+            # Store images associated with this chunk
+            if image_urls:
+                chunk_images[len(contexts) - 1] = image_urls
             
             # Collect unique media URLs
-            for img_url in image_urls:
-                if img_url not in all_images:
-                    all_images.append(img_url)
-            for vid_url in video_urls:
-                if vid_url not in all_videos:
-                    all_videos.append(vid_url)
+            images.update(dict.fromkeys(image_urls))
+            videos.update(dict.fromkeys(video_urls))
             
             # Collect image mappings (dedupe by URL)
-            seen_urls = {m.get("url") for m in all_image_mappings}
             for mapping in image_mappings:
-                if mapping.get("url") and mapping["url"] not in seen_urls:
-                    all_image_mappings.append(mapping)
-                    seen_urls.add(mapping["url"])
+                if mapping.get("url"):
+                    image_mappings_by_url.setdefault(mapping["url"], mapping)
+    
+    return RetrievalResults(
+        contexts, sources, list(images), list(videos), chunk_images, list(image_mappings_by_url.values())
+    )
+
+
+async def answer_question(req: AskRequest):
+    """Hybrid search plus (optional) LLM answer; returns (answer, contexts, sources, media)"""
+    q_emb = None
+    semantic_scope = ("ask", req.top_k, req.use_llm)
+    # Started before the embedding so the keyword scroll overlaps it; dropped on a cache hit
+    keyword_task = start_keyword_search(req.question, req.top_k)
+    try:
+        if not req.conversation_history:
+            q_emb = await get_query_embedding(req.question)
+            cached = semantic_cache.lookup(q_emb, semantic_scope)
+            if cached is not None:
+                keyword_task.cancel()
+                return cached
+
+        # Hybrid Search
+        search_res = await search_hybrid(req.question, req.top_k, q_emb=q_emb, keyword_task=keyword_task)
+    except BaseException:
+        keyword_task.cancel()
+        raise
+
+    results = assemble_results(search_res)
 
     answer = None
     if req.use_llm:
         if groq_client is None:
             raise HTTPException(status_code=400, detail="GROQ_API_KEY not set; set use_llm=false or configure key.")
 
-        system_prompt = (
-            "You are a helpful assistant for DrCloudEHR Support. "
-            "Answer using the provided context. "
-            "\n\nFORMATTING RULES:"
-            "\n- For procedures, use NUMBERED STEPS (1. 2. 3.)"
-            "\n- Each step on its OWN LINE"
-            "\n- For lists, use bullet points (•)"
-            "\n- Keep steps clear and concise"
-            "\n- Do NOT add any citations or references"
-            "\n\nIf not in context, say you don't know."
-        )
-        context_block = "\n\n".join(f"- {c}" for c in contexts[:10])
+        context_block = "- " + "\n\n- ".join(results.contexts[:10]) if results.contexts else ""
 
         # Build messages with conversation history
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = [SYSTEM_MESSAGE]
         
-        # Add conversation history if provided
-        if req.conversation_history:
-            for msg in req.conversation_history:
-                if msg.role in ["user", "assistant"]:
-                    messages.append({"role": msg.role, "content": msg.content})
+        # Add (recent) conversation history if provided
+        messages.extend(history_messages(req.conversation_history))
         
         # Add current question with context
         current_content = f"Context from knowledge base:\n{context_block}\n\nQuestion: {req.question}"
         messages.append({"role": "user", "content": current_content})
 
-        chat = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
+        chat = await create_chat_completion(
             temperature=0.2,
             messages=messages,
         )
         answer = chat.choices[0].message.content.strip() if chat.choices else ""
 
+    media = {
+        "images": results.images,
+        "videos": results.videos,
+        "image_mappings": results.image_mappings,
+    }
+    result = (answer, results.contexts, results.sources, media)
+    if not req.conversation_history:
+        semantic_cache.add(q_emb, result, semantic_scope)
+    return result
+
+
+@app.post("/ask")
+async def ask(
+    req: AskRequest,
+    background_tasks: BackgroundTasks,
+    x_user_id: Optional[str] = Header(None, alias="X-User-ID"),
+    x_site_id: Optional[str] = Header(None, alias="X-Site-ID"),
+    x_tags: Optional[str] = Header(None, alias="X-Tags"),  # Comma-separated
+):
+    if not req.question.strip():
+        raise HTTPException(status_code=400, detail="Question is empty.")
+
+    # Capture user context from headers or request body (headers take precedence)
+    user_id = x_user_id or req.user_id
+    site_id = x_site_id or req.site_id
+    tags = req.tags or (x_tags.split(",") if x_tags else [])
+    tags = [tag.strip() for tag in tags if tag.strip()]  # Clean up tags
+
+    # Identical questions (same history and options) reuse the cached answer and skip
+    # the embedding, Qdrant and Groq calls entirely
+    sync_answer_caches()
+    cache_key = answer_cache_key(req)
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is None:
+        cached = await answer_question(req)
+        ANSWER_CACHE[cache_key] = cached
+    answer, contexts, sources, media = cached
+
     # Create and save log entry (Q&A interaction)
-    ticket_id = str(uuid.uuid4())
+    # Log ids are internal (feedback only echoes them back), so a compact random id is enough
+    ticket_id = secrets.token_hex(8)
     # Logs don't need ticket numbers, only actual tickets do
     # ticket_number = get_next_ticket_number()  # Removed - logs don't get ticket numbers
     
@@ -426,7 +1002,7 @@ def ask(
         "chunks": contexts,
         "sources": sources,
         "use_llm": req.use_llm,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": now_iso(),
         "feedback": None,
         "rating": None,
         "feedback_at": None,
@@ -435,21 +1011,54 @@ def ask(
         "tags": tags,
         "filters": req.filters or {},
     }
-    save_ticket(log_entry)
+    # Written after the response is sent
+    background_tasks.add_task(save_ticket, log_entry)
 
     return {
         "ticket_id": ticket_id,
         "answer": answer,
         "chunks": contexts,
         "sources": sources,
-        "media": {
-            "images": all_images,
-            "videos": all_videos,
-            "image_mappings": all_image_mappings,
-        }
+        "media": media,
     }
 
 
+# Follow-up suggestions are optional; don't hold the end of the stream for a slow response
+SUGGESTIONS_TIMEOUT = float(os.getenv("SUGGESTIONS_TIMEOUT", "3"))
+
+
+async def generate_followups(question: str, answer: str) -> Optional[List[str]]:
+    """Up to 4 follow-up questions for /ask/stream; None if generation fails or exceeds SUGGESTIONS_TIMEOUT"""
+    follow_up_prompt = f"Based on this question: '{question}' and answer: '{answer[:500]}...', generate 3 brief follow-up questions a user might ask. Return ONLY a JSON array of strings, nothing else."
+    try:
+        follow_up_response = await asyncio.wait_for(
+            create_chat_completion(
+                temperature=0.7,
+                messages=[{"role": "user", "content": follow_up_prompt}],
+                max_tokens=200,
+            ),
+            SUGGESTIONS_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        print(f"Suggestions took longer than {SUGGESTIONS_TIMEOUT}s, skipped")
+        return None
+    except Exception as e:
+        print(f"Failed to generate suggestions: {e}")
+        return None
+    
+    suggested_text = follow_up_response.choices[0].message.content.strip()
+    # Try to parse as JSON array
+    try:
+        suggested_questions = orjson.loads(suggested_text)
+    except orjson.JSONDecodeError:
+        # Fallback: split by newlines
+        lines = [l.strip('- ').strip() for l in suggested_text.split('\n') if l.strip()]
+        return lines[:4] or None
+    if isinstance(suggested_questions, list) and len(suggested_questions) > 0:
+        return suggested_questions[:4]
+    return None
+
+
 @app.post("/ask/stream")
 async def ask_stream(
     req: AskRequest,
@@ -467,136 +1076,74 @@ async def ask_stream(
     tags = req.tags or (x_tags.split(",") if x_tags else [])
     tags = [tag.strip() for tag in tags if tag.strip()]
     
-    # Hybrid Search
-    search_res = search_hybrid(req.question, req.top_k)
-    
-    contexts = []
-    sources = []
-    all_images = []
-    all_videos = []
-    chunk_images = {}  # Map chunk index to its images
-    all_image_mappings = []  # NEW: Images with context for smart matching
-    
-    for idx, pt in enumerate(search_res):
-        payload = pt.payload or {}
-        text = payload.get("text") or ""
-        source = payload.get("source") or "unknown"
-        image_urls = payload.get("image_urls", [])
-        video_urls = payload.get("video_urls", [])
-        image_mappings = payload.get("image_mappings", [])  # NEW
+    # A rephrasing of a recent question (without conversation history) replays its answer
+    q_emb = None
+    semantic_scope = ("stream", req.top_k)
+    cached = None
+    sync_answer_caches()
+    # Started before the embedding so the keyword scroll overlaps it; dropped on a cache hit
+    keyword_task = start_keyword_search(req.question, req.top_k)
+    try:
+        if req.use_llm and not req.conversation_history:
+            q_emb = await get_query_embedding(req.question)
+            cached = semantic_cache.lookup(q_emb, semantic_scope)
         
-        if text:
-            contexts.append(text)
-            sources.append({"source": source, "score": float(pt.score)})
-            
-            # Store images associated with this chunk
-            if image_urls:
-                chunk_images[len(contexts) - 1] = image_urls
-            
-            for img_url in image_urls:
-                if img_url not in all_images:
-                    all_images.append(img_url)
-            for vid_url in video_urls:
-                if vid_url not in all_videos:
-                    all_videos.append(vid_url)
-            
-            # Collect image mappings (dedupe by URL)
-            seen_urls = {m.get("url") for m in all_image_mappings}
-            for mapping in image_mappings:
-                if mapping.get("url") and mapping["url"] not in seen_urls:
-                    all_image_mappings.append(mapping)
-                    seen_urls.add(mapping["url"])
+        if cached is not None:
+            keyword_task.cancel()
+            results = cached["results"]
+        else:
+            # Hybrid Search
+            search_res = await search_hybrid(req.question, req.top_k, q_emb=q_emb, keyword_task=keyword_task)
+            results = assemble_results(search_res)
+    except BaseException:
+        keyword_task.cancel()
+        raise
+    contexts = results.contexts
+    sources = results.sources
     
-    ticket_id = str(uuid.uuid4())
+    # Compact internal id for the log entry (see /ask)
+    ticket_id = secrets.token_hex(8)
     
     async def event_generator():
         """Generate SSE events for streaming response"""
         try:
             # Send initial metadata including images per source and image mappings for smart matching
-            yield f"data: {json.dumps({'type': 'metadata', 'ticket_id': ticket_id, 'chunks': contexts, 'sources': sources, 'media': {'images': all_images, 'videos': all_videos}, 'source_images': chunk_images, 'image_mappings': all_image_mappings})}\n\n"
+            yield sse({'type': 'metadata', 'ticket_id': ticket_id, 'chunks': contexts, 'sources': sources, 'media': {'images': results.images, 'videos': results.videos}, 'source_images': results.chunk_images, 'image_mappings': results.image_mappings})
             
             if req.use_llm:
                 if groq_client is None:
-                    yield f"data: {json.dumps({'type': 'error', 'message': 'GROQ_API_KEY not set'})}\n\n"
+                    yield sse({'type': 'error', 'message': 'GROQ_API_KEY not set'})
                     return
                 
-                system_prompt = (
-                    "You are a helpful assistant for DrCloudEHR Support. "
-                    "Answer using the provided context. "
-                    "\n\nFORMATTING RULES:"
-                    "\n- For procedures, use NUMBERED STEPS (1. 2. 3.)"
-                    "\n- Each step on its OWN LINE"
-                    "\n- For lists, use bullet points (•)"
-                    "\n- Keep steps clear and concise"
-                    "\n- Do NOT add any citations or references"
-                    "\n\nExample:"
-                    "\nTo submit DARTS records:"
-                    "\n1. Navigate to Patient Summary Chart"
-                    "\n2. Click on the DARTS tab"
-                    "\n3. Select records to submit"
-                    "\n4. Click the Submit button"
-                    "\n\nIf not in context, say you don't know."
-                )
-                
-                # Build context - images are handled separately by the frontend
-                context_entries = []
-                for i, text in enumerate(contexts[:10]):
-                    entry = f"[Source {i+1}] {text}"
-                    context_entries.append(entry)
-                context_block = "\n\n".join(context_entries)
-                
-                messages = [{"role": "system", "content": system_prompt}]
-                
-                if req.conversation_history:
-                    for msg in req.conversation_history:
-                        if msg.role in ["user", "assistant"]:
-                            messages.append({"role": msg.role, "content": msg.content})
+                if cached is not None:
+                    full_answer = cached["answer"]
+                    for piece in _STREAM_PIECE_RE.findall(full_answer):
+                        yield sse({'type': 'token', 'content': piece})
+                else:
+                    # Build context - images are handled separately by the frontend
+                    context_block = "\n\n".join(f"[Source {i}] {text}" for i, text in enumerate(contexts[:10], 1))
                 
-                current_content = f"Context from knowledge base:\n{context_block}\n\nQuestion: {req.question}"
-                messages.append({"role": "user", "content": current_content})
+                    messages = [STREAM_SYSTEM_MESSAGE]
+                    messages.extend(history_messages(req.conversation_history))
                 
-                # Stream the response
-                full_answer = ""
-                stream = groq_client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    temperature=0.2,
-                    messages=messages,
-                    stream=True,
-                )
+                    current_content = f"Context from knowledge base:\n{context_block}\n\nQuestion: {req.question}"
+                    messages.append({"role": "user", "content": current_content})
                 
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_answer += content
-                        yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
+                    # Stream the response
+                    full_answer = ""
+                    stream = await create_chat_completion(
+                        temperature=0.2,
+                        messages=messages,
+                        stream=True,
+                    )
                 
-                # Generate suggested follow-up questions
-                if full_answer:
-                    try:
-                        follow_up_prompt = f"Based on this question: '{req.question}' and answer: '{full_answer[:500]}...', generate 3 brief follow-up questions a user might ask. Return ONLY a JSON array of strings, nothing else."
-                        
-                        follow_up_response = groq_client.chat.completions.create(
-                            model=GROQ_MODEL,
-                            temperature=0.7,
-                            messages=[{"role": "user", "content": follow_up_prompt}],
-                            max_tokens=200,
-                        )
-                        
-                        suggested_text = follow_up_response.choices[0].message.content.strip()
-                        # Try to parse as JSON array
-                        try:
-                            suggested_questions = json.loads(suggested_text)
-                            if isinstance(suggested_questions, list) and len(suggested_questions) > 0:
-                                yield f"data: {json.dumps({'type': 'suggestions', 'questions': suggested_questions[:4]})}\n\n"
-                        except:
-                            # Fallback: split by newlines
-                            lines = [l.strip('- ').strip() for l in suggested_text.split('\n') if l.strip()]
-                            if lines:
-                                yield f"data: {json.dumps({'type': 'suggestions', 'questions': lines[:4]})}\n\n"
-                    except Exception as e:
-                        print(f"Failed to generate suggestions: {e}")
+                    async for chunk in stream:
+                        if chunk.choices[0].delta.content:
+                            content = chunk.choices[0].delta.content
+                            full_answer += content
+                            yield sse({'type': 'token', 'content': content})
                 
-                # Save log entry
+                # Save log entry (in the background, while the follow-up suggestions are generated)
                 log_entry = {
                     "id": ticket_id,
                     "type": "log",
@@ -605,7 +1152,7 @@ async def ask_stream(
                     "chunks": contexts,
                     "sources": sources,
                     "use_llm": req.use_llm,
-                    "created_at": datetime.utcnow().isoformat(),
+                    "created_at": now_iso(),
                     "feedback": None,
                     "rating": None,
                     "feedback_at": None,
@@ -614,17 +1161,32 @@ async def ask_stream(
                     "tags": tags,
                     "filters": req.filters or {},
                 }
-                save_ticket(log_entry)
+                save_ticket_in_background(log_entry)
+                
+                # Suggested follow-up questions
+                suggestions = None
+                if cached is not None:
+                    suggestions = cached["suggestions"]
+                elif full_answer:
+                    suggestions = await generate_followups(req.question, full_answer)
+                    if not req.conversation_history:
+                        semantic_cache.add(q_emb, {
+                            "results": results,
+                            "answer": full_answer,
+                            "suggestions": suggestions,
+                        }, semantic_scope)
+                if suggestions:
+                    yield sse({'type': 'suggestions', 'questions': suggestions})
             else:
                 # Non-LLM mode: just return chunks
                 answer = "\n\n".join(contexts[:3]) if contexts else "No relevant information found."
-                yield f"data: {json.dumps({'type': 'answer', 'content': answer})}\n\n"
+                yield sse({'type': 'answer', 'content': answer})
             
             # Send completion event
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            yield sse({'type': 'done'})
             
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            yield sse({'type': 'error', 'message': str(e)})
     
     return StreamingResponse(
         event_generator(),
@@ -637,12 +1199,12 @@ async def ask_stream(
 
 
 @app.post("/feedback")
-def submit_feedback(req: FeedbackRequest):
+async def submit_feedback(req: FeedbackRequest):
     if not req.feedback.strip():
         raise HTTPException(status_code=400, detail="Feedback cannot be empty.")
     if req.rating is not None and (req.rating < 1 or req.rating > 5):
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5.")
-    return update_ticket_feedback(req.ticket_id, req.feedback, req.rating)
+    return await asyncio.to_thread(update_ticket_feedback, req.ticket_id, req.feedback, req.rating)
 
 
 @app.get("/tickets")
@@ -655,35 +1217,13 @@ def get_tickets(
     limit: int = 1000
 ):
     """Get user-created support tickets only - excludes Q&A logs"""
-    tickets = load_tickets()
-    # Filter to only tickets (user-created support tickets)
-    filtered = [t for t in tickets if t.get("type") == "ticket" or t.get("is_support_ticket", False)]
-    
-    # Apply filters
-    if user_id:
-        filtered = [t for t in filtered if t.get("user_id") == user_id]
-    
-    if site_id:
-        filtered = [t for t in filtered if t.get("site_id") == site_id]
-    
-    if start_date:
-        start_date_normalized = start_date.split('T')[0] if 'T' in start_date else start_date
-        filtered = [t for t in filtered if t.get("created_at", "").split('T')[0] >= start_date_normalized]
-    
-    if end_date:
-        end_date_normalized = end_date.split('T')[0] if 'T' in end_date else end_date
-        filtered = [t for t in filtered if t.get("created_at", "").split('T')[0] <= end_date_normalized]
-    
-    if tags:
-        tag_list = [tag.strip() for tag in tags.split(",")]
-        filtered = [t for t in filtered if any(tag in (t.get("tags") or []) for tag in tag_list)]
-    
-    # Sort by date (newest first) and limit
-    filtered.sort(key=lambda x: x.get("created_at", "") or "1970-01-01T00:00:00", reverse=True)
+    # All filters, the newest-first sort and the limit run in SQLite
+    tag_list = [tag.strip() for tag in tags.split(",")] if tags else None
+    results, total = ticket_store.query("ticket", user_id, site_id, start_date, end_date, tag_list, limit)
     
     return {
-        "tickets": filtered[:limit],
-        "total": len(filtered),
+        "tickets": results,
+        "total": total,
         "filters_applied": {
             "user_id": user_id,
             "site_id": site_id,
@@ -696,11 +1236,10 @@ def get_tickets(
 
 @app.get("/tickets/{ticket_id}")
 def get_ticket(ticket_id: str):
-    tickets = load_tickets()
-    for ticket in tickets:
-        if ticket.get("id") == ticket_id:
-            return ticket
-    raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket = ticket_store.get(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
 
 
 @app.post("/upload-attachment")
@@ -713,34 +1252,36 @@ async def upload_attachment(
     if not user_id or not ticket_id:
         raise HTTPException(status_code=400, detail="user_id and ticket_id are required")
     
-    uploaded_paths = []
-    upload_dir = get_upload_path(user_id, ticket_id)
-    
-    for index, file in enumerate(files, start=1):
-        # Validate file extension
+    # Validate every file's type and declared size before writing anything
+    for file in files:
         file_ext = Path(file.filename).suffix.lower()
         if file_ext not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
                 detail=f"File type {file_ext} not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
             )
-        
-        # Read file content to check size
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
+        if file.size is not None and file.size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=400,
                 detail=f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE / (1024*1024)}MB"
             )
-        
+    
+    uploaded_paths = []
+    upload_dir = get_upload_path(user_id, ticket_id)
+    
+    for index, file in enumerate(files, start=1):
         # Sanitize filename and create numbered filename
         sanitized_name = sanitize_filename(file.filename)
         numbered_filename = f"{index}_{sanitized_name}"
         file_path = upload_dir / numbered_filename
         
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Stream to disk in one worker-thread hop per file, still checking the size as we go
+        # (size may be unknown up front)
+        if not await asyncio.to_thread(copy_upload, file.file, file_path, MAX_FILE_SIZE):
+            raise HTTPException(
+                status_code=400,
+                detail=f"File {file.filename} exceeds maximum size of {MAX_FILE_SIZE / (1024*1024)}MB"
+            )
         
         # Store relative path (from backend directory)
         # Path format: uploads/{date}/{user_id}/{ticket_id}/{index}_{filename}
@@ -754,7 +1295,7 @@ async def upload_attachment(
 
 
 @app.post("/create-ticket")
-def create_ticket(
+async def create_ticket(
     req: CreateTicketRequest,
     x_user_id: Optional[str] = Header(None, alias="X-User-ID"),
     x_site_id: Optional[str] = Header(None, alias="X-Site-ID"),
@@ -785,27 +1326,13 @@ def create_ticket(
     
     # Use provided ticket_id or generate new one
     ticket_id = req.ticket_id or str(uuid.uuid4())
-    # Generate ticket number
-    ticket_number = get_next_ticket_number()
     
-    # Extract the user's original question from conversation history (first user message)
-    # This is more reliable than req.question which might contain the LLM answer
-    user_question = req.question  # Fallback to req.question
-    if req.conversation_history:
-        # Find the first user message in conversation history
-        for msg in req.conversation_history:
-            if msg.role == "user" and msg.content:
-                user_question = msg.content
-                break
-    
-    # Extract the last assistant answer from conversation history (the answer user was not satisfied with)
-    last_answer = None
-    if req.conversation_history:
-        # Find the last assistant message in conversation history
-        for msg in reversed(req.conversation_history):
-            if msg.role == "assistant":
-                last_answer = msg.content
-                break
+    # The user's original question is the first user message in the conversation history (more
+    # reliable than req.question, which might contain the LLM answer); the answer they were not
+    # satisfied with is the last assistant message. Both scans stop at the first match.
+    history = req.conversation_history or []
+    user_question = next((msg.content for msg in history if msg.role == "user" and msg.content), req.question)
+    last_answer = next((msg.content for msg in reversed(history) if msg.role == "assistant"), None)
     
     # Build comprehensive context for Jira integration
     context = {
@@ -823,13 +1350,13 @@ def create_ticket(
         "user_id": user_id,
         "site_id": site_id,
         "tags": tags,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": now_iso(),
     }
     
     ticket = {
         "id": ticket_id,
         "type": "ticket",  # Mark as ticket (user-created support ticket)
-        "ticket_number": ticket_number,  # Auto-assigned ticket number
+        "ticket_number": None,  # Auto-assigned when saved
         "title": req.title,
         "category": req.category,
         "severity": req.severity or "Medium",
@@ -840,12 +1367,12 @@ def create_ticket(
         "chunks": [],
         "sources": [],
         "use_llm": False,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": now_iso(),
         "feedback": req.reason or "User requested support ticket - not satisfied with answer",
         "rating": None,
-        "feedback_at": datetime.utcnow().isoformat(),
+        "feedback_at": now_iso(),
         "is_support_ticket": True,
-        "conversation_history": [{"role": m.role, "content": m.content} for m in (req.conversation_history or [])],
+        "conversation_history": [{"role": m.role, "content": m.content} for m in history],
         "user_id": user_id,
         "site_id": site_id,
         "tags": tags,
@@ -854,56 +1381,84 @@ def create_ticket(
         "context": context,  # NEW: Full context for dashboard and Jira export
         "jira_status": "not_exported",  # Track Jira export status
     }
-    save_ticket(ticket)
-    return {"ticket_id": ticket_id, "ticket_number": ticket_number, "message": "Support ticket created successfully"}
+    await asyncio.to_thread(save_numbered_ticket, ticket)
+    return {"ticket_id": ticket_id, "ticket_number": ticket["ticket_number"], "message": "Support ticket created successfully"}
 
 
 @app.get("/files/{file_path:path}")
-def get_file(file_path: str):
+async def get_file(file_path: str, request: Request):
     """Serve uploaded files"""
-    file_full_path = Path(__file__).parent / file_path
-    # Security: ensure file is within uploads directory
-    uploads_abs = Path(__file__).parent / "uploads"
-    try:
-        file_full_path.resolve().relative_to(uploads_abs.resolve())
-    except ValueError:
+    # Security: ensure file is within uploads directory (normpath collapses any ../)
+    target = os.path.normpath(os.path.join(BACKEND_ROOT, file_path))
+    if not target.startswith(UPLOADS_ROOT + os.sep):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    if not file_full_path.exists():
+    st = regular_file_stat(target)
+    if st is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(file_full_path)
+    headers = {"Cache-Control": FILES_CACHE_CONTROL, "ETag": file_etag(st)}
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if FILES_ACCEL_REDIRECT_PREFIX:
+        # nginx streams the file itself; no file bytes pass through Python
+        relative_path = target[len(UPLOADS_ROOT) + 1:].replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{FILES_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(relative_path)}"
+        return Response(headers=headers)
+    
+    # Starlette streams the file (using sendfile where the server supports it)
+    media_type = MEDIA_TYPES.get(os.path.splitext(target)[1].lower())
+    return FileResponse(target, headers=headers, media_type=media_type, stat_result=st)
+
+
+# (URL prefix, directory) pairs /media serves from, resolved once: the KB samples first, then
+# images extracted from parsed documents (linked as /media/extracted_media/...). Only
+# extracted_media/ itself is exposed, not the rest of backend/ (databases, .env, uploads).
+MEDIA_ROOTS = (
+    ("", (Path(__file__).parent.parent / "samples").resolve()),
+    ("extracted_media/", (Path(__file__).parent / "extracted_media").resolve()),
+)
 
 
 @app.get("/media/{file_path:path}")
-def get_media(file_path: str):
+def get_media(file_path: str, request: Request):
     """Serve media files (images, videos) from samples or extracted_media directories"""
-    # Try samples directory first
-    samples_path = Path(__file__).parent.parent / "samples" / file_path
-    if samples_path.exists() and samples_path.is_file():
-        return FileResponse(samples_path)
-    
-    # Try extracted_media directory
-    extracted_path = Path(__file__).parent / file_path
-    if extracted_path.exists() and extracted_path.is_file():
-        return FileResponse(extracted_path)
-    
-    # Security check: ensure file is within allowed directories
-    backend_dir = Path(__file__).parent
-    samples_dir = backend_dir.parent / "samples"
-    
-    try:
-        # Check if path is within samples or extracted_media
-        if samples_path.exists():
-            samples_path.resolve().relative_to(samples_dir.resolve())
-        elif extracted_path.exists():
-            extracted_path.resolve().relative_to(backend_dir.resolve())
-        else:
-            raise HTTPException(status_code=404, detail="Media file not found")
-    except ValueError:
+    escaped = False
+    for prefix, root in MEDIA_ROOTS:
+        if not file_path.startswith(prefix):
+            continue
+        candidate = (root / file_path[len(prefix):]).resolve()
+        # Security: only serve files that stay within the root after resolving ../ and symlinks
+        try:
+            relative = candidate.relative_to(root)
+        except ValueError:
+            escaped = True
+            continue
+        # Hidden entries (e.g. the parser's .cache/ of pickled chunks) aren't media
+        if any(part.startswith(".") for part in relative.parts):
+            continue
+        st = regular_file_stat(candidate)
+        if st is not None:
+            headers = {"Cache-Control": MEDIA_CACHE_CONTROL, "ETag": file_etag(st)}
+            if not_modified(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+            return FileResponse(
+                candidate, headers=headers, media_type=MEDIA_TYPES.get(candidate.suffix.lower()), stat_result=st
+            )
+
+    if escaped:
         raise HTTPException(status_code=403, detail="Access denied")
-    
-    return FileResponse(samples_path if samples_path.exists() else extracted_path)
+    raise HTTPException(status_code=404, detail="Media file not found")
+
+
+# NDJSON responses are sent in pieces of this many entries
+NDJSON_BATCH_SIZE = 100
+
+
+async def ndjson_stream(rows: List[str]):
+    """One JSON document per line, from entries that are already JSON text."""
+    for start in range(0, len(rows), NDJSON_BATCH_SIZE):
+        yield "".join(f"{row}\n" for row in rows[start:start + NDJSON_BATCH_SIZE]).encode()
 
 
 @app.get("/logs")
@@ -913,42 +1468,27 @@ def get_logs(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     tags: Optional[str] = None,  # Comma-separated
-    limit: int = 1000
+    limit: int = 1000,
+    response_format: str = Query("json", alias="format"),  # "ndjson" streams one log per line
 ):
     """Get logs (Q&A interactions) with filtering options - excludes user-created tickets"""
-    tickets = load_tickets()
-    
-    # Filter to only logs (Q&A interactions), exclude tickets
-    filtered = [t for t in tickets if t.get("type") == "log" or (t.get("type") != "ticket" and not t.get("is_support_ticket", False))]
-    
-    if user_id:
-        filtered = [t for t in filtered if t.get("user_id") == user_id]
-    
-    if site_id:
-        filtered = [t for t in filtered if t.get("site_id") == site_id]
-    
-    if start_date:
-        # Handle ISO format dates (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)
-        start_date_normalized = start_date.split('T')[0] if 'T' in start_date else start_date
-        filtered = [t for t in filtered if t.get("created_at", "").split('T')[0] >= start_date_normalized]
-    
-    if end_date:
-        # Handle ISO format dates - add time to include the full day
-        end_date_normalized = end_date.split('T')[0] if 'T' in end_date else end_date
-        # For end_date, we want to include the entire day, so compare date part only
-        filtered = [t for t in filtered if t.get("created_at", "").split('T')[0] <= end_date_normalized]
-    
-    if tags:
-        tag_list = [tag.strip() for tag in tags.split(",")]
-        filtered = [t for t in filtered if any(tag in (t.get("tags") or []) for tag in tag_list)]
-    
-    # Sort by date (newest first) and limit
-    # Handle both ISO format and empty dates
-    filtered.sort(key=lambda x: x.get("created_at", "") or "1970-01-01T00:00:00", reverse=True)
+    # All filters, the newest-first sort and the limit run in SQLite (dates compare the
+    # YYYY-MM-DD part, so end_date includes the entire day)
+    tag_list = [tag.strip() for tag in tags.split(",")] if tags else None
+    if response_format == "ndjson":
+        # Stored rows are already JSON, so they are streamed as-is without decoding them;
+        # the match count goes in a header
+        rows, total = ticket_store.query_raw("log", user_id, site_id, start_date, end_date, tag_list, limit)
+        return StreamingResponse(
+            ndjson_stream(rows),
+            media_type="application/x-ndjson",
+            headers={"X-Total-Count": str(total)},
+        )
+    results, total = ticket_store.query("log", user_id, site_id, start_date, end_date, tag_list, limit)
     
     return {
-        "logs": filtered[:limit],
-        "total": len(filtered),
+        "logs": results,
+        "total": total,
         "filters_applied": {
             "user_id": user_id,
             "site_id": site_id,
@@ -959,8 +1499,39 @@ def get_logs(
     }
 
 
-# Initialize parser
-doc_parser = DocumentParser()
+# Point ids of uploaded documents are derived from (file name, content digest, chunk number), so
+# processing the same upload again overwrites its points instead of adding copies
+DOC_POINT_NAMESPACE = uuid.UUID("6f1c2a4e-93d5-4c1b-8f7e-2b5d0c9a4e71")
+
+
+async def existing_content_hashes(hashes: Set[str]) -> Set[str]:
+    """Which of the given content hashes already have a point in the collection (one filtered scroll)."""
+    found = set()
+    if not hashes:
+        return found
+    hash_filter = qmodels.Filter(must=[
+        qmodels.FieldCondition(key="content_hash", match=qmodels.MatchAny(any=list(hashes))),
+    ])
+    offset = None
+    while True:
+        points, offset = await client.scroll(
+            QDRANT_COLLECTION,
+            scroll_filter=hash_filter,
+            limit=max(len(hashes), 64),
+            offset=offset,
+            with_payload=["content_hash"],
+            with_vectors=False,
+        )
+        found.update(point.payload["content_hash"] for point in points)
+        if offset is None:
+            return found
+
+
+@app.on_event("startup")
+def init_doc_parser():
+    # Per worker at startup rather than at import (the parser sets up extracted_media/ and its parse cache)
+    app.state.doc_parser = DocumentParser()
+
 
 @app.post("/admin/upload-doc")
 async def admin_upload_doc(file: UploadFile = File(...)):
@@ -977,25 +1548,44 @@ async def admin_upload_doc(file: UploadFile = File(...)):
     
     file_path = samples_dir / filename
     
-    # Save file
-    content = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Save file, copied in 1MB pieces so large documents never sit in memory whole, hashing
+    # the content on the way (disk write and parsing are blocking, keep them off the event loop)
+    digest = hashlib.blake2b(digest_size=16)
+
+    def save_upload():
+        with open(file_path, "wb") as f:
+            for piece in iter(lambda: file.file.read(1024 * 1024), b""):
+                digest.update(piece)
+                f.write(piece)
+
+    await asyncio.to_thread(save_upload)
+    doc_key = f"{filename}|{digest.hexdigest()}"
+    relative_file_path = str(file_path.relative_to(Path(__file__).parent.parent))
         
     try:
-        # Parse document
-        chunks = doc_parser.parse_document(str(file_path))
+        # Parse document (an unchanged document comes from the parser's content-hash cache)
+        chunks = await asyncio.to_thread(app.state.doc_parser.parse_document, str(file_path), use_cache=True)
         
         if not chunks:
             return {"message": "File uploaded but no text content found", "chunks": 0}
-            
+        
+        # Chunks whose text is already stored (boilerplate shared with other documents, or an
+        # unchanged re-upload) or repeated within this document are not embedded again
+        hashes = [content_hash(chunk.text) for chunk in chunks]
+        await ensure_collection_ready()
+        known_hashes = await existing_content_hashes(set(hashes))
+        
         # Convert to UpsertItems
         items = []
-        for chunk in chunks:
+        for i, (chunk, chunk_hash) in enumerate(zip(chunks, hashes)):
+            if chunk_hash in known_hashes:
+                continue
+            known_hashes.add(chunk_hash)
             chunk_dict = chunk.to_dict()
             items.append(UpsertItem(
                 text=chunk_dict["text"],
                 source=chunk_dict["source"],
+                id=str(uuid.uuid5(DOC_POINT_NAMESPACE, f"{doc_key}|{i}")),
                 metadata={
                     "image_urls": chunk_dict["image_urls"],
                     "video_urls": chunk_dict["video_urls"],
@@ -1003,16 +1593,26 @@ async def admin_upload_doc(file: UploadFile = File(...)):
                 }
             ))
             
+        if not items:
+            return {
+                "message": f"{filename} is already in the knowledge base",
+                "chunks": len(chunks),
+                "upserted": 0,
+                "duplicates_skipped": len(chunks),
+                "file_path": relative_file_path,
+            }
+            
         # Upsert to Qdrant
         # Reuse the upsert endpoint logic
         req = UpsertRequest(items=items)
-        result = upsert(req)
+        result = await upsert(req)
         
         return {
             "message": f"Successfully processed {filename}",
             "chunks": len(chunks),
             "upserted": result.get("upserted", 0),
-            "file_path": str(file_path.relative_to(Path(__file__).parent.parent))
+            "duplicates_skipped": len(chunks) - len(items),
+            "file_path": relative_file_path
         }
         
     except Exception as e:
@@ -1021,22 +1621,22 @@ async def admin_upload_doc(file: UploadFile = File(...)):
 
 
 @app.get("/admin/stats")
-def admin_stats():
+async def admin_stats():
     """Get knowledge base statistics"""
     try:
+        await ensure_collection_ready()
         # Get collection info
-        info = client.get_collection(QDRANT_COLLECTION)
+        info = await client.get_collection(QDRANT_COLLECTION)
         vector_count = info.points_count
         
-        # Get tickets/logs count
-        tickets = load_tickets()
-        total_interactions = len(tickets)
-        support_tickets = sum(1 for t in tickets if t.get("type") == "ticket" or t.get("is_support_ticket", False))
-        feedback_count = sum(1 for t in tickets if t.get("feedback"))
+        # Get tickets/logs counts (aggregated in the database, no tickets are decoded)
+        ticket_stats = await asyncio.to_thread(ticket_store.stats)
+        total_interactions = ticket_stats["total"]
+        support_tickets = ticket_stats["support_tickets"]
+        feedback_count = ticket_stats["feedback"]
         avg_rating = 0
-        rated_tickets = [t for t in tickets if t.get("rating")]
-        if rated_tickets:
-            avg_rating = sum(t.get("rating") for t in rated_tickets) / len(rated_tickets)
+        if ticket_stats["rated"]:
+            avg_rating = ticket_stats["rating_sum"] / ticket_stats["rated"]
             
         return {
             "documents": {
@@ -1061,125 +1661,137 @@ def admin_stats():
 @app.get("/tickets/{ticket_id}/context")
 def get_ticket_context(ticket_id: str):
     """Get full context of a ticket for detailed view"""
-    tickets = load_tickets()
-    for ticket in tickets:
-        if ticket.get("id") == ticket_id or ticket.get("ticket_number") == ticket_id:
-            # Build comprehensive context if not already stored
-            context = ticket.get("context") or {
-                "title": ticket.get("title", ""),
-                "category": ticket.get("category", ""),
-                "severity": ticket.get("severity", "Medium"),
-                "description": ticket.get("description", ""),
-                "additional_notes": ticket.get("additional_notes", ""),
-                "reason_for_ticket": ticket.get("feedback", ""),
-                "original_question": ticket.get("question", ""),
-                "chatbot_response": ticket.get("answer", ""),
-                "attachment_count": len(ticket.get("attachments", [])),
-                "attachment_paths": ticket.get("attachments", []),
-                "user_id": ticket.get("user_id", ""),
-                "site_id": ticket.get("site_id", ""),
-                "tags": ticket.get("tags", []),
-                "created_at": ticket.get("created_at", ""),
-            }
-            return {
-                "ticket_id": ticket.get("id"),
-                "ticket_number": ticket.get("ticket_number"),
-                "context": context,
-                "conversation_history": ticket.get("conversation_history", []),
-                "jira_status": ticket.get("jira_status", "not_exported"),
-            }
-    raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket = ticket_store.find(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    # Build comprehensive context if not already stored
+    context = ticket.get("context") or {
+        "title": ticket.get("title", ""),
+        "category": ticket.get("category", ""),
+        "severity": ticket.get("severity", "Medium"),
+        "description": ticket.get("description", ""),
+        "additional_notes": ticket.get("additional_notes", ""),
+        "reason_for_ticket": ticket.get("feedback", ""),
+        "original_question": ticket.get("question", ""),
+        "chatbot_response": ticket.get("answer", ""),
+        "attachment_count": len(ticket.get("attachments", [])),
+        "attachment_paths": ticket.get("attachments", []),
+        "user_id": ticket.get("user_id", ""),
+        "site_id": ticket.get("site_id", ""),
+        "tags": ticket.get("tags", []),
+        "created_at": ticket.get("created_at", ""),
+    }
+    return {
+        "ticket_id": ticket.get("id"),
+        "ticket_number": ticket.get("ticket_number"),
+        "context": context,
+        "conversation_history": ticket.get("conversation_history", []),
+        "jira_status": ticket.get("jira_status", "not_exported"),
+    }
+
+
+# Map severity to Jira priority
+_SEVERITY_TO_PRIORITY = {
+    "Low": "Low",
+    "Medium": "Medium",
+    "High": "High",
+    "Critical": "Highest"
+}
+
+# Map category to Jira issue type
+_CATEGORY_TO_TYPE = {
+    "Bug": "Bug",
+    "Feature Request": "Story",
+    "Question": "Task",
+    "Incident": "Bug",
+    "Change Request": "Story"
+}
+
+# Appended to every exported ticket's own tags
+_DEFAULT_LABELS = ("drcloudehr", "support-bot")
+
+
+def _jira_section(title: str, body) -> str:
+    """A titled description section, or "" when there's nothing to put in it"""
+    return f"*{title}:*\n{body}\n\n" if body else ""
+
+
+def _jira_payload(ticket: dict, project_key: Optional[str] = "DRCLOUD") -> dict:
+    """Jira issue-creation payload for a stored ticket"""
+    # Build Jira-compatible description (one f-string; optional sections render as "")
+    context = ticket.get("context", {})
+    
+    answer = ticket.get("answer") or ""
+    answer_preview = answer[:500] + "..." if len(answer) > 500 else answer
+    
+    attachments = ticket.get("attachments", [])
+    attachments_section = (
+        f"*Attachments ({len(attachments)}):*\n" + "".join(f"- {att}\n" for att in attachments)
+        if attachments else ""
+    )
+    
+    # Conversation history summary
+    conv_history = ticket.get("conversation_history", [])
+    history_section = ""
+    if conv_history:
+        history_section = f"\n\n*Conversation History ({len(conv_history)} messages):*"
+        for i, msg in enumerate(conv_history[:5]):  # First 5 messages
+            role = msg.get("role", "unknown").capitalize()
+            content = msg.get("content") or ""
+            if len(content) > 200:
+                content = content[:200] + "..."
+            history_section += f"\n{i+1}. [{role}]: {content}"
+        if len(conv_history) > 5:
+            history_section += f"\n   ... and {len(conv_history) - 5} more messages"
+    
+    description = (
+        f"*Description:*\n{ticket.get('description', 'N/A')}\n\n"
+        f"{_jira_section('Additional Notes', context.get('additional_notes'))}"
+        f"*Reason for Ticket:*\n{context.get('reason_for_ticket', ticket.get('feedback', 'N/A'))}\n\n"
+        f"{_jira_section('Original User Question', ticket.get('question'))}"
+        f"{_jira_section('Chatbot Response (User Not Satisfied)', answer_preview)}"
+        f"{attachments_section}"
+        f"\n*User ID:* {ticket.get('user_id', 'anonymous')}\n"
+        f"*Site ID:* {ticket.get('site_id', 'N/A')}\n"
+        f"*Internal Ticket:* {ticket.get('ticket_number', ticket.get('id'))}"
+        f"{history_section}"
+    )
+    
+    return {
+        "fields": {
+            "project": {
+                "key": project_key  # Defaults to a placeholder - user should configure
+            },
+            "summary": ticket.get("title", f"Support Ticket: {ticket.get('ticket_number', 'Unknown')}"),
+            "description": description,
+            "issuetype": {
+                "name": _CATEGORY_TO_TYPE.get(ticket.get("category", "Question"), "Task")
+            },
+            "priority": {
+                "name": _SEVERITY_TO_PRIORITY.get(ticket.get("severity", "Medium"), "Medium")
+            },
+            "labels": [*ticket.get("tags", []), *_DEFAULT_LABELS],
+        }
+    }
+
+
+def _jira_export(ticket: dict, project_key: Optional[str] = "DRCLOUD") -> dict:
+    return {
+        "ticket_number": ticket.get("ticket_number"),
+        "jira_payload": _jira_payload(ticket, project_key),
+        "raw_context": ticket.get("context", {}),
+        "export_timestamp": now_iso(),
+    }
 
 
 @app.get("/tickets/{ticket_id}/jira-export")
 def export_ticket_to_jira_format(ticket_id: str):
     """Export a single ticket in Jira-compatible JSON format"""
-    tickets = load_tickets()
-    for ticket in tickets:
-        if ticket.get("id") == ticket_id or ticket.get("ticket_number") == ticket_id:
-            # Map severity to Jira priority
-            severity_to_priority = {
-                "Low": "Low",
-                "Medium": "Medium", 
-                "High": "High",
-                "Critical": "Highest"
-            }
-            
-            # Map category to Jira issue type
-            category_to_type = {
-                "Bug": "Bug",
-                "Feature Request": "Story",
-                "Question": "Task",
-                "Incident": "Bug",
-                "Change Request": "Story"
-            }
-            
-            # Build Jira-compatible description
-            context = ticket.get("context", {})
-            description_parts = []
-            
-            description_parts.append(f"*Description:*\n{ticket.get('description', 'N/A')}\n")
-            
-            if context.get("additional_notes"):
-                description_parts.append(f"*Additional Notes:*\n{context.get('additional_notes')}\n")
-            
-            description_parts.append(f"*Reason for Ticket:*\n{context.get('reason_for_ticket', ticket.get('feedback', 'N/A'))}\n")
-            
-            if ticket.get("question"):
-                description_parts.append(f"*Original User Question:*\n{ticket.get('question')}\n")
-            
-            if ticket.get("answer"):
-                answer_preview = ticket.get("answer", "")[:500] + "..." if len(ticket.get("answer", "")) > 500 else ticket.get("answer", "")
-                description_parts.append(f"*Chatbot Response (User Not Satisfied):*\n{answer_preview}\n")
-            
-            attachments = ticket.get("attachments", [])
-            if attachments:
-                description_parts.append(f"*Attachments ({len(attachments)}):*")
-                for att in attachments:
-                    description_parts.append(f"- {att}")
-            
-            description_parts.append(f"\n*User ID:* {ticket.get('user_id', 'anonymous')}")
-            description_parts.append(f"*Site ID:* {ticket.get('site_id', 'N/A')}")
-            description_parts.append(f"*Internal Ticket:* {ticket.get('ticket_number', ticket.get('id'))}")
-            
-            # Conversation history summary
-            conv_history = ticket.get("conversation_history", [])
-            if conv_history:
-                description_parts.append(f"\n*Conversation History ({len(conv_history)} messages):*")
-                for i, msg in enumerate(conv_history[:5]):  # First 5 messages
-                    role = msg.get("role", "unknown").capitalize()
-                    content = msg.get("content", "")[:200]
-                    if len(msg.get("content", "")) > 200:
-                        content += "..."
-                    description_parts.append(f"{i+1}. [{role}]: {content}")
-                if len(conv_history) > 5:
-                    description_parts.append(f"   ... and {len(conv_history) - 5} more messages")
-            
-            jira_format = {
-                "fields": {
-                    "project": {
-                        "key": "DRCLOUD"  # Placeholder - user should configure
-                    },
-                    "summary": ticket.get("title", f"Support Ticket: {ticket.get('ticket_number', 'Unknown')}"),
-                    "description": "\n".join(description_parts),
-                    "issuetype": {
-                        "name": category_to_type.get(ticket.get("category", "Question"), "Task")
-                    },
-                    "priority": {
-                        "name": severity_to_priority.get(ticket.get("severity", "Medium"), "Medium")
-                    },
-                    "labels": ticket.get("tags", []) + ["drcloudehr", "support-bot"],
-                }
-            }
-            
-            return {
-                "ticket_number": ticket.get("ticket_number"),
-                "jira_payload": jira_format,
-                "raw_context": context,
-                "export_timestamp": datetime.utcnow().isoformat(),
-            }
-    
-    raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket = ticket_store.find(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return _jira_export(ticket)
 
 
 class JiraBulkExportRequest(BaseModel):
@@ -1190,26 +1802,16 @@ class JiraBulkExportRequest(BaseModel):
 @app.post("/tickets/jira-export-bulk")
 def export_tickets_bulk(req: JiraBulkExportRequest):
     """Export multiple tickets in Jira-compatible format for bulk import"""
-    tickets = load_tickets()
     exports = []
     not_found = []
     
     for tid in req.ticket_ids:
-        found = False
-        for ticket in tickets:
-            if ticket.get("id") == tid or ticket.get("ticket_number") == tid:
-                found = True
-                # Get single export
-                try:
-                    export = export_ticket_to_jira_format(tid)
-                    # Update project key
-                    export["jira_payload"]["fields"]["project"]["key"] = req.project_key
-                    exports.append(export)
-                except:
-                    not_found.append(tid)
-                break
-        if not found:
+        # Indexed lookup by id or ticket number, then format directly with the requested project key
+        ticket = ticket_store.find(tid)
+        if ticket is None:
             not_found.append(tid)
+            continue
+        exports.append(_jira_export(ticket, req.project_key))
     
     return {
         "exported": len(exports),
@@ -1223,19 +1825,24 @@ def export_tickets_bulk(req: JiraBulkExportRequest):
 @app.post("/tickets/{ticket_id}/mark-exported")
 def mark_ticket_exported(ticket_id: str):
     """Mark a ticket as exported to Jira"""
-    tickets = load_tickets()
-    updated = False
-    
-    for ticket in tickets:
-        if ticket.get("id") == ticket_id or ticket.get("ticket_number") == ticket_id:
-            ticket["jira_status"] = "exported"
-            ticket["jira_exported_at"] = datetime.utcnow().isoformat()
-            updated = True
-            break
+    ticket = ticket_store.find(ticket_id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
     
-    if updated:
-        with open(TICKETS_FILE, "w", encoding="utf-8") as f:
-            json.dump(tickets, f, indent=2, ensure_ascii=False)
-        return {"message": "Ticket marked as exported", "status": "exported"}
-    
-    raise HTTPException(status_code=404, detail="Ticket not found")
+    # find() returns a shared cached dict, so update the stored copy instead of mutating it
+    ticket_store.set_fields(ticket["id"], {"jira_status": "exported", "jira_exported_at": now_iso()})
+    return {"message": "Ticket marked as exported", "status": "exported"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop event loop + httptools C parser (both ship with uvicorn[standard]).
+    # For production use gunicorn with several UvicornWorker processes (see START_SERVERS.md).
+    uvicorn.run(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+    )
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Reset Qdrant collection - deletes and recreates it fresh."""
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
@@ -36,9 +37,20 @@ client.recreate_collection(
         size=VECTOR_SIZE,
         distance=qmodels.Distance.COSINE,
     ),
+    # Same int8 scalar quantization as main.ensure_collection
+    quantization_config=qmodels.ScalarQuantization(
+        scalar=qmodels.ScalarQuantizationConfig(
+            type=qmodels.ScalarType.INT8,
+            quantile=0.99,
+            always_ram=True,
+        ),
+    ),
 )
 
 print(f"✓ Created fresh collection")
-print(f"\nNow run: python seed_kb.py")
+
+# Make the API re-check the collection (and create its text index) on its next start
+Path(os.getenv("QDRANT_COLLECTION_SENTINEL", "/tmp/qdrant_collection_ready")).unlink(missing_ok=True)
+print(f"\nNow run: python seed_kb.py  (or python seed_kb.py --direct to upload straight to Qdrant)")
 
 
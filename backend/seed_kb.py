@@ -4,21 +4,146 @@ Seed the knowledge base with initial documents from the samples/ directory.
 Supports multi-modal content: .txt, .html, .pdf files with embedded media.
 Run this once to populate your Qdrant collection with company knowledge base content.
 """
-import json
+import argparse
+import asyncio
 import os
 import sys
+import uuid
 from pathlib import Path
-from urllib import request
+
+import httpx
+import orjson
+from dotenv import load_dotenv
+from openai import OpenAI
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qmodels
 
 # Import the new document parser
-from document_parser import parse_directory
+from document_parser import content_hash, parse_directory
+from kb_generation import KBGeneration
 
 ROOT = Path(__file__).parent.parent
 SAMPLES_DIR = ROOT / "samples"
 API_BASE = os.environ.get("API_BASE", "http://localhost:8000")
+# Batches in flight at once; the server embeds and upserts each one while the next is sent
+SEED_CONCURRENCY = int(os.environ.get("SEED_CONCURRENCY", "4"))
+
+# --direct mode: embed here and bulk-upload straight to Qdrant, bypassing the API
+DIRECT_EMBED_BATCH_SIZE = 256
+DIRECT_UPLOAD_BATCH_SIZE = 256
+DIRECT_UPLOAD_PARALLEL = 8
+# Qdrant's default indexing threshold, restored if the collection doesn't report its own
+QDRANT_DEFAULT_INDEXING_THRESHOLD = 20000
+
+
+async def send_batches(upsert_url: str, items: list, batch_size: int) -> bool:
+    """POST items to /upsert in batches, up to SEED_CONCURRENCY at a time over one keep-alive client."""
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    total_batches = len(batches)
+    total_upserted = 0
+    semaphore = asyncio.Semaphore(SEED_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def send(batch_num: int, batch: list):
+            nonlocal total_upserted
+            async with semaphore:
+                resp = await client.post(
+                    upsert_url,
+                    content=orjson.dumps({"items": batch}),
+                    headers={"Content-Type": "application/json"},
+                )
+            try:
+                resp.raise_for_status()
+            except httpx.HTTPStatusError:
+                print(f"  ✗ Batch {batch_num}/{total_batches} failed - HTTP {resp.status_code}: {resp.text}")
+                raise
+            upserted = orjson.loads(resp.content).get('upserted', 0)
+            total_upserted += upserted
+            print(f"  ✓ Batch {batch_num}/{total_batches}: Upserted {upserted} chunks")
+
+        tasks = [asyncio.create_task(send(n, batch)) for n, batch in enumerate(batches, 1)]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            if not isinstance(e, httpx.HTTPStatusError):
+                print(f"  ✗ Upsert failed: {e}")
+                print(f"  Make sure the backend is running at {API_BASE}")
+            print(f"\n✓ Partial success: {total_upserted} chunks upserted before error")
+            return False
+
+    print(f"\n✓ Successfully seeded {total_upserted} chunks to knowledge base")
+    return True
+
+
+def upload_direct(items: list):
+    """
+    Embed items locally and write them to Qdrant with upload_collection (parallel batched
+    uploads over gRPC when QDRANT_PREFER_GRPC is set). Payloads match the API's /upsert.
+    """
+    load_dotenv()
+    collection = os.getenv("QDRANT_COLLECTION", "kb_documents")
+    embed_model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+    client = QdrantClient(
+        url=os.getenv("QDRANT_URL"),
+        api_key=os.getenv("QDRANT_API_KEY"),
+        timeout=60,
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes"),
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+    )
+    if not client.collection_exists(collection):
+        print(f"✗ Collection {collection} does not exist; run reset_collection.py or start the API first")
+        sys.exit(1)
+
+    oa = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    vectors = []
+    for i in range(0, len(items), DIRECT_EMBED_BATCH_SIZE):
+        batch = items[i:i + DIRECT_EMBED_BATCH_SIZE]
+        resp = oa.embeddings.create(model=embed_model, input=[item["text"] for item in batch])
+        vectors.extend(d.embedding for d in resp.data)
+        print(f"  ✓ Embedded {len(vectors)}/{len(items)} chunks")
+
+    payloads = [
+        {
+            "text": item["text"],
+            "content_hash": content_hash(item["text"]),
+            "source": item["source"],
+            "image_urls": item["metadata"]["image_urls"],
+            "video_urls": item["metadata"]["video_urls"],
+            "source_doc": item["metadata"]["source_doc"],
+            "image_mappings": item["metadata"]["image_mappings"],
+        }
+        for item in items
+    ]
+
+    # Build the HNSW index once after the upload instead of incrementally during it, then put
+    # back the collection's own indexing threshold
+    indexing_threshold = client.get_collection(collection).config.optimizer_config.indexing_threshold
+    if indexing_threshold is None:
+        # An unset value in the restoring update would mean "no change" and leave indexing off
+        indexing_threshold = QDRANT_DEFAULT_INDEXING_THRESHOLD
+    client.update_collection(collection, optimizers_config=qmodels.OptimizersConfigDiff(indexing_threshold=0))
+    try:
+        client.upload_collection(
+            collection_name=collection,
+            vectors=vectors,
+            payload=payloads,
+            ids=[str(uuid.uuid4()) for _ in items],
+            batch_size=DIRECT_UPLOAD_BATCH_SIZE,
+            parallel=DIRECT_UPLOAD_PARALLEL,
+            wait=True,
+        )
+    finally:
+        client.update_collection(
+            collection, optimizers_config=qmodels.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+        )
 
+    # Running API workers see the new generation and drop their cached answers
+    KBGeneration().bump()
+    print(f"\n✓ Successfully uploaded {len(items)} chunks to {collection}")
 
-def seed_from_directory(directory: Path = SAMPLES_DIR):
+def seed_from_directory(directory: Path = SAMPLES_DIR, direct: bool = False):
     """Read all supported files from directory and seed them to the knowledge base."""
     if not directory.exists():
         print(f"Directory {directory} does not exist. Creating it...")
@@ -40,7 +165,8 @@ def seed_from_directory(directory: Path = SAMPLES_DIR):
     
     # Parse all documents using the multi-modal parser
     try:
-        chunks = parse_directory(directory, extensions=['.txt', '.html', '.htm', '.pdf'])
+        # Unchanged files are served from the parser's content-hash cache
+        chunks = parse_directory(directory, extensions=['.txt', '.html', '.htm', '.pdf'], use_cache=True)
     except Exception as e:
         print(f"✗ Error parsing documents: {e}")
         sys.exit(1)
@@ -69,54 +195,36 @@ def seed_from_directory(directory: Path = SAMPLES_DIR):
     print(f"  - With images: {sum(1 for item in items if item['metadata']['image_urls'])}")
     print(f"  - With videos: {sum(1 for item in items if item['metadata']['video_urls'])}")
 
+    if direct:
+        print(f"\nUploading directly to Qdrant ({DIRECT_UPLOAD_PARALLEL} parallel uploads)...")
+        upload_direct(items)
+        return
+
     # Send to API in batches to avoid token limits
     upsert_url = f"{API_BASE}/upsert"
     batch_size = 50  # Send 50 chunks at a time
-    total_upserted = 0
-    
-    print(f"\nSending in batches of {batch_size}...")
-    
-    for i in range(0, len(items), batch_size):
-        batch = items[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (len(items) + batch_size - 1) // batch_size
-        
-        data = json.dumps({"items": batch}).encode("utf-8")
-        req = request.Request(
-            upsert_url,
-            data=data,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
 
-        try:
-            with request.urlopen(req, timeout=120) as resp:
-                body = resp.read().decode("utf-8")
-                result = json.loads(body)
-                upserted = result.get('upserted', 0)
-                total_upserted += upserted
-                print(f"  ✓ Batch {batch_num}/{total_batches}: Upserted {upserted} chunks")
-        except request.HTTPError as e:
-            error_body = e.read().decode("utf-8")
-            print(f"  ✗ Batch {batch_num}/{total_batches} failed - HTTP {e.code}: {error_body}")
-            print(f"\n✓ Partial success: {total_upserted} chunks upserted before error")
-            sys.exit(1)
-        except Exception as e:
-            print(f"  ✗ Batch {batch_num}/{total_batches} failed: {e}")
-            print(f"  Make sure the backend is running at {API_BASE}")
-            print(f"\n✓ Partial success: {total_upserted} chunks upserted before error")
-            sys.exit(1)
-    
-    print(f"\n✓ Successfully seeded {total_upserted} chunks to knowledge base")
+    print(f"\nSending in batches of {batch_size} ({SEED_CONCURRENCY} concurrent)...")
+
+    if not asyncio.run(send_batches(upsert_url, items, batch_size)):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the knowledge base from samples/")
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="embed locally and bulk-upload straight to Qdrant instead of going through the API",
+    )
+    args = parser.parse_args()
+
     print("=" * 60)
     print("Multi-Modal Knowledge Base Seeding")
     print("=" * 60)
     print("\nSupported formats: .txt, .html, .pdf")
     print("Extracts: text, images, videos\n")
-    seed_from_directory()
+    seed_from_directory(direct=args.direct)
     print("\n" + "=" * 60)
     print("Done! You can now ask questions in the app.")
     print("=" * 60)
@@ -5,6 +5,7 @@ Run this once to populate your Qdrant collection with company knowledge base con
 """
 import json
 import os
+import re
 import sys
 from pathlib import Path
 from urllib import request
@@ -13,6 +14,8 @@ ROOT = Path(__file__).parent.parent
 SAMPLES_DIR = ROOT / "samples"
 API_BASE = os.environ.get("API_BASE", "http://localhost:8000")
 
+_WS_RE = re.compile(r"\s+")
+
 
 def read_text_file(path: Path) -> str:
     """Read a text file and return its content."""
@@ -22,21 +25,15 @@ def read_text_file(path: Path) -> str:
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list:
     """Split text into chunks with overlap for better context."""
-    text = " ".join(text.split())  # Normalize whitespace
+    text = _WS_RE.sub(" ", text).strip()  # Normalize whitespace
     if not text:
         return []
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + chunk_size)
-        chunk = text[start:end]
-        if chunk.strip():
-            chunks.append(chunk)
-        if end == len(text):
-            break
-        start = max(0, end - overlap)
-    return chunks
+    if len(text) <= chunk_size:
+        return [text]
+
+    # Windows starting at or after len(text) - overlap would sit inside the previous one
+    starts = range(0, len(text) - overlap, chunk_size - overlap)
+    return [chunk for chunk in (text[start:start + chunk_size] for start in starts) if chunk.strip()]
 
 
 def seed_from_directory(directory: Path = SAMPLES_DIR):
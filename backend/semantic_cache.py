@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Semantic (near-duplicate) answer cache.
+Keeps the embeddings of recently answered questions in a numpy matrix; a new question whose
+embedding is close enough (cosine similarity) to a cached one reuses that answer.
+"""
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Fixed-capacity ring of (normalized embedding, payload) entries with a TTL.
+    Entries are grouped by `scope` (e.g. endpoint + options); lookups only match the same scope.
+    When full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, dim: int, capacity: int = 512, threshold: float = 0.93, ttl: float = 7 * 24 * 3600):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._expires = np.zeros(capacity, dtype=np.float64)  # 0 marks an empty slot
+        self._scopes = np.full(capacity, -1, dtype=np.int32)
+        self._payloads = [None] * capacity
+        self._scope_ids: Dict[Hashable, int] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, vec, scope: Hashable = None) -> Optional[Any]:
+        """Payload of the most similar live entry in `scope`, if its similarity reaches the threshold."""
+        q = self._normalize(vec)
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if scope_id is not None:
+                # Cosine similarity against every slot in one matrix-vector product
+                sims = self._vectors @ q
+                live = (self._scopes == scope_id) & (self._expires > time.time())
+                sims = np.where(live, sims, -1.0)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return self._payloads[best]
+            self.misses += 1
+            return None
+
+    def add(self, vec, payload: Any, scope: Hashable = None):
+        """Store a payload (treated as read-only from now on) under the query embedding."""
+        q = self._normalize(vec)
+        with self._lock:
+            scope_id = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            slot = self._next
+            self._vectors[slot] = q
+            self._scopes[slot] = scope_id
+            self._expires[slot] = time.time() + self.ttl
+            self._payloads[slot] = payload
+            self._next = (slot + 1) % self.capacity
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._scopes[:] = -1
+            self._payloads = [None] * self.capacity
+            self._next = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "size": int(np.count_nonzero(self._expires > time.time())),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+            }
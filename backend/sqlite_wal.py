@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Connection setup shared by the SQLite-backed stores (tickets, embeddings, KB generation).
+"""
+import sqlite3
+from pathlib import Path
+
+# Writes append to the WAL; after each checkpoint folds it back into the database the
+# file is truncated to this size, so it doesn't stay at its high-water mark
+JOURNAL_SIZE_LIMIT = 10 * 1024 * 1024
+
+
+def connect_wal(db_path: Path) -> sqlite3.Connection:
+    """
+    Open a database in WAL mode (readers don't block the writer, also across processes) in
+    autocommit mode, with the connection usable from any thread. Stores keep one such
+    connection and serialize access to it with a lock, since they're called from worker threads.
+    """
+    conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA journal_size_limit={JOURNAL_SIZE_LIMIT}")
+    return conn
@@ -10,11 +10,11 @@ def test_imports():
     """Test that all required modules can be imported."""
     print("Testing imports...")
     try:
-        from bs4 import BeautifulSoup
-        print("  ✓ BeautifulSoup imported")
+        from selectolax.lexbor import LexborHTMLParser
+        print("  ✓ selectolax (lexbor) imported")
     except ImportError as e:
-        print(f"  ✗ BeautifulSoup import failed: {e}")
-        print("    Run: pip install beautifulsoup4")
+        print(f"  ✗ selectolax import failed: {e}")
+        print("    Run: pip install selectolax")
         return False
     
     try:
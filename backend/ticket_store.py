@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed storage for support tickets and Q&A logs.
+Each ticket is one row (the full ticket dict in `data`), with the fields the
+dashboard filters on promoted to indexed columns.
+"""
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from sqlite_wal import connect_wal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    user_id TEXT,
+    site_id TEXT,
+    created_at TEXT NOT NULL DEFAULT '',
+    ticket_number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_type_created ON tickets(type, created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_site ON tickets(site_id);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def ticket_kind(ticket: Dict[str, Any]) -> str:
+    """'ticket' for user-created support tickets, 'log' for Q&A interactions."""
+    if ticket.get("type") == "ticket" or ticket.get("is_support_ticket", False):
+        return "ticket"
+    return "log"
+
+
+class TicketStore:
+    """Tickets and logs in a single SQLite database (WAL mode)."""
+
+    # Distinct filter combinations kept decoded between writes
+    MAX_CACHED_QUERIES = 256
+
+    def __init__(self, db_path: Path, legacy_json: Optional[Path] = None):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = connect_wal(self.db_path)
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        # Decoded results of all()/query(), reused until the data changes. Our own writes
+        # bump _writes; commits from other connections/processes change PRAGMA data_version.
+        self._writes = 0
+        self._cache: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._cache_version = None
+
+        if legacy_json is not None:
+            self._import_legacy_json(Path(legacy_json))
+        self._seed_ticket_counter()
+
+    def _migrate(self):
+        """Bring databases created by older versions up to the current schema."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tickets)")}
+        if "ticket_number" not in columns:
+            self._conn.execute("ALTER TABLE tickets ADD COLUMN ticket_number TEXT")
+            self._conn.execute("UPDATE tickets SET ticket_number = json_extract(data, '$.ticket_number')")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tickets_ticket_number ON tickets(ticket_number) WHERE ticket_number IS NOT NULL"
+        )
+
+    def _import_legacy_json(self, json_path: Path):
+        """One-time migration of the old tickets.json into an empty database."""
+        if not json_path.exists():
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM tickets LIMIT 1").fetchone():
+                return
+        with open(json_path, "rb") as f:
+            tickets = orjson.loads(f.read())
+        self.insert_many(tickets)
+        print(f"Migrated {len(tickets)} tickets from {json_path.name} to {self.db_path.name}")
+
+    def _seed_ticket_counter(self):
+        """Start the ticket-number counter at the highest existing TKT-XXXX (first run only)."""
+        with self._lock:
+            # BEGIN IMMEDIATE takes the database write lock, so workers starting together on
+            # a fresh database can't interleave the check and the insert
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO counters (name, value) "
+                    "SELECT 'ticket_number', COALESCE(MAX(CAST(substr(ticket_number, 5) AS INTEGER)), 0) "
+                    "FROM tickets WHERE ticket_number LIKE 'TKT-%'"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _next_ticket_number(self) -> int:
+        """Increment and return the ticket-number counter (caller holds the lock, inside a transaction)."""
+        (value,) = self._conn.execute(
+            "UPDATE counters SET value = value + 1 WHERE name = 'ticket_number' RETURNING value"
+        ).fetchone()
+        return value
+
+    def insert_numbered(self, ticket: Dict[str, Any], number_format: str = "TKT-{:04d}") -> Dict[str, Any]:
+        """
+        Assign the next ticket number (formatted into ticket["ticket_number"]) and insert the
+        ticket in one transaction, so a failed insert doesn't use up a number.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ticket["ticket_number"] = number_format.format(self._next_ticket_number())
+                self._conn.execute(
+                    "INSERT INTO tickets (id, type, user_id, site_id, created_at, ticket_number, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._row(ticket),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._writes += 1
+        return ticket
+
+    @staticmethod
+    def _row(ticket: Dict[str, Any]) -> tuple:
+        return (
+            ticket["id"],
+            ticket_kind(ticket),
+            ticket.get("user_id"),
+            ticket.get("site_id"),
+            ticket.get("created_at") or "",
+            ticket.get("ticket_number"),
+            orjson.dumps(ticket).decode(),
+        )
+
+    def insert(self, ticket: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tickets (id, type, user_id, site_id, created_at, ticket_number, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._row(ticket),
+            )
+            self._writes += 1
+        return ticket
+
+    def insert_many(self, tickets: List[Dict[str, Any]]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tickets (id, type, user_id, site_id, created_at, ticket_number, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [self._row(t) for t in tickets if t.get("id")],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._writes += 1
+
+    def set_fields(self, ticket_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Set top-level fields of a stored ticket in place (SQLite json_set, no read-modify-write
+        round trip) and return the updated ticket, or None if there is no such ticket.
+        If the fields already hold these values the row isn't rewritten.
+        Only for fields that aren't promoted to columns (type, user_id, site_id, created_at, ticket_number).
+        """
+        assignments = ", ".join(f"'$.\"{key}\"', json(?)" for key in fields)
+        params = [orjson.dumps(value).decode() for value in fields.values()]
+        with self._lock:
+            row = self._conn.execute(
+                f"UPDATE tickets SET data = json_set(data, {assignments}) "
+                f"WHERE id = ? AND data IS NOT json_set(data, {assignments}) RETURNING data",
+                (*params, ticket_id, *params),
+            ).fetchone()
+            if row:
+                self._writes += 1
+            else:
+                # Unchanged (or missing): return the stored ticket as is
+                row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def find(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a ticket by id or by ticket number (e.g. TKT-0001), id matches first.
+        Served from the decoded-query cache between writes; the returned dict is shared, don't mutate it.
+        """
+        rows = self._cached_select(
+            ("find", ticket_id),
+            """
+            SELECT data FROM (
+                SELECT data, 0 AS priority, rowid AS position FROM tickets WHERE id = ?
+                UNION ALL
+                SELECT data, 1 AS priority, rowid AS position FROM tickets WHERE ticket_number = ?
+            ) ORDER BY priority, position LIMIT 1
+            """,
+            (ticket_id, ticket_id),
+        )
+        return rows[0] if rows else None
+
+    def _cached_select(self, key: tuple, sql: str, params=(), count_sql: Optional[str] = None):
+        """
+        Run a SELECT of `data` rows and decode it, or return the decoded list from a previous
+        identical call if nothing was written since. Returned dicts are shared; don't mutate them.
+        With count_sql (same params), returns (rows, count) instead of just the rows.
+        """
+        with self._lock:
+            version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes)
+            if version != self._cache_version:
+                self._cache.clear()
+                self._cache_version = version
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            rows = self._conn.execute(sql, params).fetchall()
+            if count_sql is not None:
+                total = self._conn.execute(count_sql, params[:-1]).fetchone()[0]
+
+        result = [orjson.loads(r[0]) for r in rows]
+        if count_sql is not None:
+            result = (result, total)
+        with self._lock:
+            if self._cache_version == version:
+                if len(self._cache) >= self.MAX_CACHED_QUERIES:
+                    self._cache.clear()
+                self._cache[key] = result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Totals for the admin dashboard: entries, support tickets, entries with feedback, and the
+        count and sum of (non-zero) ratings. Aggregated in SQLite, cached between writes like query().
+        """
+        rows = self._cached_select(
+            ("stats",),
+            """
+            SELECT json_object(
+                'total', COUNT(*),
+                'support_tickets', COUNT(*) FILTER (WHERE type = 'ticket'),
+                'feedback', COUNT(*) FILTER (WHERE feedback NOT IN ('', 0)),
+                'rated', COUNT(rating),
+                'rating_sum', TOTAL(rating)
+            ) FROM (
+                SELECT type,
+                       json_extract(data, '$.feedback') AS feedback,
+                       NULLIF(json_extract(data, '$.rating'), 0) AS rating
+                FROM tickets
+            )
+            """,
+        )
+        return rows[0]
+
+    @staticmethod
+    def _where(
+        kind: str,
+        user_id: Optional[str],
+        site_id: Optional[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        tags: Optional[List[str]],
+    ) -> Tuple[str, List[Any]]:
+        """WHERE clause and parameters for query() / query_raw()."""
+        clauses = ["type = ?"]
+        params: List[Any] = [kind]
+        if user_id:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if site_id:
+            clauses.append("site_id = ?")
+            params.append(site_id)
+        # Plain range comparisons on created_at so SQLite can use idx_tickets_type_created
+        if start_date:
+            clauses.append("created_at >= ?")
+            params.append(start_date.split('T')[0])
+        if end_date:
+            clauses.append("created_at < date(?, '+1 day')")
+            params.append(end_date.split('T')[0])
+        if tags:
+            placeholders = ", ".join("?" * len(tags))
+            clauses.append(f"EXISTS (SELECT 1 FROM json_each(data, '$.tags') WHERE value IN ({placeholders}))")
+            params.extend(tags)
+        return " AND ".join(clauses), params
+
+    def query(
+        self,
+        kind: str,
+        user_id: Optional[str] = None,
+        site_id: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        limit: int = 1000,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Up to `limit` tickets or logs matching the filters, newest first, and the total match count.
+        Dates are YYYY-MM-DD (any time part is ignored); end_date includes the whole day.
+        `tags` matches entries carrying any of the given tags.
+        """
+        where, params = self._where(kind, user_id, site_id, start_date, end_date, tags)
+        sql = f"SELECT data FROM tickets WHERE {where} ORDER BY created_at DESC, rowid DESC LIMIT ?"
+        count_sql = f"SELECT COUNT(*) FROM tickets WHERE {where}"
+        params.append(max(limit, 0))
+        return self._cached_select(("query", sql, *params), sql, params, count_sql=count_sql)
+
+    def query_raw(
+        self,
+        kind: str,
+        user_id: Optional[str] = None,
+        site_id: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        limit: int = 1000,
+    ) -> Tuple[List[str], int]:
+        """Same as query(), but each entry is its stored JSON text (nothing is decoded)."""
+        where, params = self._where(kind, user_id, site_id, start_date, end_date, tags)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM tickets WHERE {where} ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                (*params, max(limit, 0)),
+            ).fetchall()
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tickets WHERE {where}", params).fetchone()[0]
+        return [row[0] for row in rows], total
@@ -0,0 +1,64 @@
+"""
+Disk-backed cache of chunk embeddings, so re-ingesting a PDF doesn't re-run the model
+on chunks it has already seen. Vectors are kept as raw float32 bytes keyed by
+blake2b(model, text).
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+# Keys per SELECT ... IN (...), under SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """SQLite (WAL mode) map from embedding_key() to a float32 vector."""
+
+    def __init__(self, db_path: str):
+        # One shared connection; FastAPI runs sync endpoints in worker threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(Path(db_path)), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Cached vectors (read-only float32 arrays) for whichever of `keys` are present."""
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[bytes, np.ndarray]]):
+        rows = [(key, vector.astype(np.float32, copy=False).tobytes()) for key, vector in entries]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
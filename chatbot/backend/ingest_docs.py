@@ -8,8 +8,11 @@ Usage:
 """
 
 import argparse
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List
 
 # Add parent directory to path to import from main
 sys.path.insert(0, str(Path(__file__).parent))
@@ -19,9 +22,20 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Import after loading env vars
-# Note: Importing main.py will initialize qdrant_client, embedding_model, etc.
-from main import ingest_pdf_document, QDRANT_COLLECTION
+from pdf_text import pdf_chunks
+
+_main = None
+
+
+def _get_main():
+    """
+    Import main on first use. Importing it connects to Qdrant and loads the embedding
+    model, which --help, argument errors and the parsing worker processes don't need.
+    """
+    global _main
+    if _main is None:
+        import main as _main
+    return _main
 
 
 def get_doc_id_from_filename(filepath: str) -> str:
@@ -43,6 +57,26 @@ def ingest_file(filepath: str) -> int:
         FileNotFoundError: If file doesn't exist
         ValueError: If ingestion fails
     """
+    # A lone file gets every core for page extraction
+    return embed_and_upsert(*parse_and_chunk(filepath, workers=os.cpu_count() or 1))
+
+
+def parse_and_chunk(filepath: str, workers: int = 1) -> tuple[str, List[str]]:
+    """
+    Read and chunk a PDF file without touching the embedding model or Qdrant,
+    so it can run in a worker process.
+    
+    Args:
+        filepath: Path to the PDF file
+        workers: Processes to extract a long PDF's pages with (see extract_text_from_pdf)
+    
+    Returns:
+        Tuple of (doc_id, text_chunks)
+    
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        ValueError: If the file can't be read or parsed
+    """
     filepath = Path(filepath)
     if not filepath.exists():
         raise FileNotFoundError(f"File not found: {filepath}")
@@ -54,23 +88,30 @@ def ingest_file(filepath: str) -> int:
         raise ValueError(f"Unsupported file type (expected .pdf): {filepath}")
 
     try:
-        with open(filepath, "rb") as f:
-            pdf_bytes = f.read()
+        file_size = filepath.stat().st_size
     except Exception as exc:
         raise ValueError(f"Failed to read file: {exc}") from exc
 
-    if not pdf_bytes:
+    if not file_size:
         raise ValueError(f"File is empty: {filepath}")
 
     doc_id = get_doc_id_from_filename(filepath)
     
+    # PDFium reads the file from disk itself rather than from a copy in memory
     try:
-        chunks_indexed = ingest_pdf_document(doc_id, pdf_bytes)
-        return chunks_indexed
+        return doc_id, pdf_chunks(filepath, workers)
     except Exception as exc:
         raise ValueError(f"Failed to ingest {filepath}: {exc}") from exc
 
 
+def embed_and_upsert(doc_id: str, text_chunks: List[str]) -> int:
+    """Embed a document's chunks and upsert them into Qdrant; returns the number indexed."""
+    try:
+        return _get_main().index_chunks(doc_id, text_chunks)
+    except Exception as exc:
+        raise ValueError(f"Failed to ingest {doc_id}: {exc}") from exc
+
+
 def ingest_all_from_docs_folder(docs_folder: str = "./docs") -> tuple[int, int]:
     """
     Ingest all PDF files from the docs folder.
@@ -102,15 +143,21 @@ def ingest_all_from_docs_folder(docs_folder: str = "./docs") -> tuple[int, int]:
     successful_docs = 0
     failed_docs = []
     
-    for pdf_file in sorted(pdf_files):
-        try:
-            chunks = ingest_file(str(pdf_file))
-            total_chunks += chunks
-            successful_docs += 1
-            print(f"✓ {pdf_file.name}: {chunks} chunk(s)")
-        except Exception as exc:
-            failed_docs.append((pdf_file.name, str(exc)))
-            print(f"✗ {pdf_file.name}: Failed - {exc}")
+    # Parsing and chunking (CPU bound) runs across worker processes; embedding and
+    # upserts stay in this process, which holds the model and the Qdrant client
+    pdf_files = sorted(pdf_files)
+    max_workers = min(os.cpu_count() or 1, len(pdf_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        parsed = [executor.submit(parse_and_chunk, str(pdf_file)) for pdf_file in pdf_files]
+        for pdf_file, future in zip(pdf_files, parsed):
+            try:
+                chunks = embed_and_upsert(*future.result())
+                total_chunks += chunks
+                successful_docs += 1
+                print(f"✓ {pdf_file.name}: {chunks} chunk(s)")
+            except Exception as exc:
+                failed_docs.append((pdf_file.name, str(exc)))
+                print(f"✗ {pdf_file.name}: Failed - {exc}")
     
     print("-" * 60)
     
@@ -163,7 +210,7 @@ Examples:
     try:
         if args.all:
             print(f"Ingesting all documents from {args.docs_folder}...")
-            print(f"Qdrant collection: {QDRANT_COLLECTION}")
+            print(f"Qdrant collection: {_get_main().QDRANT_COLLECTION}")
             print("=" * 60)
             num_docs, total_chunks = ingest_all_from_docs_folder(args.docs_folder)
             print(f"\n✓ Ingested {num_docs} document(s), {total_chunks} chunk(s) total.")
@@ -171,7 +218,7 @@ Examples:
         
         elif args.file:
             print(f"Ingesting file: {args.file}")
-            print(f"Qdrant collection: {QDRANT_COLLECTION}")
+            print(f"Qdrant collection: {_get_main().QDRANT_COLLECTION}")
             print("-" * 60)
             chunks = ingest_file(args.file)
             doc_id = get_doc_id_from_filename(args.file)
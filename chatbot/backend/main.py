@@ -1,19 +1,33 @@
+import asyncio
 import os
 import uuid
-from io import BytesIO
-from typing import List
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastembed import TextEmbedding
+import numpy as np
 from openai import OpenAI
 from pydantic import BaseModel
-from PyPDF2 import PdfReader
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, PointStruct, VectorParams
+from qdrant_client.http.models import (
+    Distance,
+    PointStruct,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
 import uvicorn
 
+from embedding_cache import EmbeddingCache, embedding_key
+from pdf_text import pdf_chunks
+
 
 load_dotenv()
 
@@ -27,10 +41,23 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "docs_chunks")
+# gRPC (protobuf instead of JSON for vectors); set QDRANT_PREFER_GRPC=false for REST-only deployments
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 
 EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
 EMBEDDING_DIM = 384
 CHAT_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+# Texts per ONNX forward pass when embedding many at once
+EMBED_BATCH_SIZE = 32
+# ONNX Runtime intra-op threads: pinned rather than one per core, so several uvicorn
+# workers don't oversubscribe the CPU (BGE-small gains little past ~4)
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "4"))
+# e.g. "CUDAExecutionProvider,CPUExecutionProvider" on a GPU host
+EMBED_PROVIDERS = os.getenv("EMBED_PROVIDERS", "CPUExecutionProvider").split(",")
+# Points per Qdrant upsert while ingesting; also how many chunks are embedded at a time
+UPSERT_BATCH_SIZE = 64
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", str(Path(__file__).parent / "embed_cache.db"))
 
 if not GROQ_API_KEY:
     raise RuntimeError("GROQ_API_KEY must be set")
@@ -42,33 +69,107 @@ if not QDRANT_API_KEY:
     raise RuntimeError("QDRANT_API_KEY must be set")
 
 
+# Point ids are derived from (doc_id, chunk index), so re-ingesting a document overwrites
+# its points instead of adding copies
+CHUNK_POINT_NAMESPACE = uuid.UUID("3b8e6d2f-5a71-4c9e-9d04-7f2a1c6e8b53")
+
+# int8 scalar quantization: vectors are searched as int8 in RAM (4x smaller than float32)
+# and the top candidates are rescored against the original vectors
+QUANTIZATION_CONFIG = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(
+        type=ScalarType.INT8,
+        quantile=0.99,
+        always_ram=True,
+    ),
+)
+SEARCH_PARAMS = SearchParams(
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0),
+)
+
+
 def init_qdrant_collection() -> QdrantClient:
-    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    client = QdrantClient(
+        url=QDRANT_URL,
+        api_key=QDRANT_API_KEY,
+        timeout=30,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+    )
     collections = client.get_collections().collections or []
     existing = {collection.name for collection in collections}
     if QDRANT_COLLECTION not in existing:
         client.create_collection(
             collection_name=QDRANT_COLLECTION,
             vectors_config=VectorParams(size=EMBEDDING_DIM, distance=Distance.COSINE),
+            quantization_config=QUANTIZATION_CONFIG,
+        )
+    elif client.get_collection(QDRANT_COLLECTION).config.quantization_config is None:
+        # Collections created before quantization was enabled get it added in place
+        client.update_collection(
+            collection_name=QDRANT_COLLECTION,
+            quantization_config=QUANTIZATION_CONFIG,
         )
     return client
 
 
 qdrant_client = init_qdrant_collection()
-embedding_model = TextEmbedding(model_name=EMBEDDING_MODEL)
+embedding_model = TextEmbedding(model_name=EMBEDDING_MODEL, threads=EMBED_THREADS, providers=EMBED_PROVIDERS)
+embedding_cache = EmbeddingCache(EMBED_CACHE_PATH)
 llm_client = OpenAI(
     api_key=GROQ_API_KEY,
     base_url="https://api.groq.com/openai/v1",
 )
 
 
-def embed_text(text: str) -> List[float]:
+def embed_texts(texts: List[str]) -> List[np.ndarray]:
+    """
+    Embed many texts, batched through the model EMBED_BATCH_SIZE at a time.
+    Texts already in the embedding cache skip the model entirely. Vectors are float32
+    arrays, which qdrant-client serializes without a round trip through Python floats.
+    """
+    keys = [embedding_key(EMBEDDING_MODEL, text) for text in texts]
+    vectors = embedding_cache.get_many(keys)
+
+    missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+    if missing:
+        # FastEmbed returns a generator of numpy arrays
+        embedded = embedding_model.embed(list(missing.values()), batch_size=EMBED_BATCH_SIZE)
+        new_vectors = dict(zip(missing, (embedding.astype(np.float32, copy=False) for embedding in embedded)))
+        embedding_cache.put_many(new_vectors.items())
+        vectors.update(new_vectors)
+
+    return [vectors[key] for key in keys]
+
+
+def embed_text(text: str) -> np.ndarray:
     text = text.strip()
     if not text:
         raise ValueError("Cannot embed empty text")
-    # FastEmbed returns a generator of numpy arrays
-    embedding = next(embedding_model.embed([text]))
-    return embedding.tolist()
+    return embed_texts([text])[0]
+
+
+@lru_cache(maxsize=4096)
+def embed_question(question: str) -> np.ndarray:
+    """embed_text() memoized in process, so repeated questions skip even the disk cache."""
+    vector = embed_text(question)
+    # Shared between requests
+    vector.flags.writeable = False
+    return vector
+
+
+# The prompt is laid out constant-first (system message, then the fixed instructions that
+# open the user message) so every request shares the longest possible token prefix
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful assistant that answers questions from the provided context.",
+}
+USER_TEMPLATE = (
+    "The context contains relevant information - extract and synthesize the answer from it. "
+    "Only say 'I don't know' if the context truly does not contain any relevant information to answer the question."
+    "\n\nQuestion: {question}\n\nContext:\n{context}"
+)
+# Caps decoding time per answer
+ANSWER_MAX_TOKENS = 1024
 
 
 def generate_answer(context_chunks: List[str], question: str) -> str:
@@ -80,64 +181,20 @@ def generate_answer(context_chunks: List[str], question: str) -> str:
     )
 
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a helpful assistant. Use the provided context to answer the user's question. "
-                "The context contains relevant information - extract and synthesize the answer from it. "
-                "Only say 'I don't know' if the context truly does not contain any relevant information to answer the question."
-            ),
-        },
-        {
-            "role": "user",
-            "content": f"Question: {question}\n\nContext:\n{context_text}",
-        },
+        SYSTEM_MESSAGE,
+        {"role": "user", "content": USER_TEMPLATE.format(question=question, context=context_text)},
     ]
 
     completion = llm_client.chat.completions.create(
         model=CHAT_MODEL,
         messages=messages,
         temperature=0.2,
+        max_tokens=ANSWER_MAX_TOKENS,
     )
 
     return completion.choices[0].message.content.strip()
 
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract raw text from a PDF file."""
-    try:
-        pdf_reader = PdfReader(BytesIO(file_content))
-        text_parts = []
-        for page in pdf_reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text_parts.append(extracted)
-        return "\n\n".join(text_parts)
-    except Exception as exc:  # pragma: no cover - external dependency
-        raise ValueError(f"Failed to parse PDF: {exc}") from exc
-
-
-def chunk_text(text: str, max_words: int = 400) -> List[str]:
-    """Turn raw text into ~max_words chunks."""
-    words = text.split()
-    if not words:
-        return []
-
-    chunks: List[str] = []
-    current_chunk: List[str] = []
-
-    for word in words:
-        current_chunk.append(word)
-        if len(current_chunk) >= max_words:
-            chunks.append(" ".join(current_chunk).strip())
-            current_chunk = []
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk).strip())
-
-    return chunks
-
-
 app = FastAPI(
     title="Multi-modal RAG Backend",
     description="Approach 1: text embeddings + media payload via Qdrant",
@@ -161,54 +218,72 @@ def ingest_pdf_document(doc_id: str, pdf_bytes: bytes) -> int:
         doc_id: Identifier for the PDF (usually filename with extension)
         pdf_bytes: Raw PDF bytes
     """
-    text = extract_text_from_pdf(pdf_bytes)
-    if not text.strip():
-        raise ValueError("No text content found in PDF.")
+    return index_chunks(doc_id, pdf_chunks(pdf_bytes))
 
-    text_chunks = chunk_text(text)
-    if not text_chunks:
-        raise ValueError("No valid chunks produced from PDF content.")
 
-    points: List[PointStruct] = []
-    for chunk_index, text_chunk in enumerate(text_chunks):
-        if len(text_chunk.split()) < 5:
-            continue
+def index_chunks(doc_id: str, text_chunks: List[str]) -> int:
+    """
+    Embed a document's text chunks and upsert them into Qdrant.
 
-        try:
-            embedding = embed_text(text_chunk)
-        except Exception as exc:
-            raise ValueError(f"Embedding failed: {exc}") from exc
-
-        payload = {
-            "doc_id": doc_id,
-            "chunk_index": chunk_index,
-            "text_chunk": text_chunk,
-            "image_urls": [],
-            "video_urls": [],
-            "source_doc": doc_id,
-        }
-
-        points.append(
-            PointStruct(
-                id=str(uuid.uuid4()),
-                vector=embedding,
-                payload=payload,
-            )
-        )
+    Args:
+        doc_id: Identifier for the PDF (usually filename with extension)
+        text_chunks: Output of pdf_chunks()
+    """
+    # Chunks under chunk_text's min_words were already dropped
+    eligible = list(enumerate(text_chunks))
 
-    if not points:
+    if not eligible:
         raise ValueError("No chunks met the minimum length requirement.")
 
-    try:
-        qdrant_client.upsert(collection_name=QDRANT_COLLECTION, points=points)
-    except Exception as exc:
-        raise ValueError(f"Qdrant upsert failed: {exc}") from exc
+    # Embed and upsert UPSERT_BATCH_SIZE chunks at a time so memory stays flat on large
+    # PDFs. Only the last upsert waits: Qdrant applies a collection's updates in order,
+    # so earlier batches are written while the next one is being embedded.
+    # Boilerplate chunks (headers, footers, legal text) repeat within a document, so each
+    # distinct text is embedded once and its vector reused for every occurrence.
+    embedded: Dict[str, np.ndarray] = {}
+    for start in range(0, len(eligible), UPSERT_BATCH_SIZE):
+        batch = eligible[start:start + UPSERT_BATCH_SIZE]
+        new_texts = list(dict.fromkeys(text_chunk for _, text_chunk in batch if text_chunk not in embedded))
+        if new_texts:
+            try:
+                embedded.update(zip(new_texts, embed_texts(new_texts)))
+            except Exception as exc:
+                raise ValueError(f"Embedding failed: {exc}") from exc
+
+        points: List[PointStruct] = []
+        for chunk_index, text_chunk in batch:
+            embedding = embedded[text_chunk]
+            payload = {
+                "doc_id": doc_id,
+                "chunk_index": chunk_index,
+                "text_chunk": text_chunk,
+                "image_urls": [],
+                "video_urls": [],
+                "source_doc": doc_id,
+            }
+
+            points.append(
+                PointStruct(
+                    id=str(uuid.uuid5(CHUNK_POINT_NAMESPACE, f"{doc_id}|{chunk_index}")),
+                    vector=embedding,
+                    payload=payload,
+                )
+            )
+
+        try:
+            qdrant_client.upsert(
+                collection_name=QDRANT_COLLECTION,
+                points=points,
+                wait=start + UPSERT_BATCH_SIZE >= len(eligible),
+            )
+        except Exception as exc:
+            raise ValueError(f"Qdrant upsert failed: {exc}") from exc
 
-    return len(points)
+    return len(eligible)
 
 
 @app.post("/query")
-def query_documents(request: QueryRequest):
+async def query_documents(request: QueryRequest):
     question = request.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question must not be empty.")
@@ -216,36 +291,49 @@ def query_documents(request: QueryRequest):
     top_k = request.top_k or 5
     top_k = max(1, min(top_k, 20))
 
+    # The embedding model, Qdrant and Groq clients are blocking; each call runs in a
+    # worker thread so the event loop keeps serving other requests meanwhile
     try:
-        query_vector = embed_text(question)
+        query_vector = await asyncio.to_thread(embed_question, question)
     except Exception as exc:  # pragma: no cover - external service
         raise HTTPException(status_code=500, detail=f"Embedding failed: {exc}") from exc
 
     try:
-        search_result = qdrant_client.search(
+        search_result = await asyncio.to_thread(
+            qdrant_client.search,
             collection_name=QDRANT_COLLECTION,
             query_vector=query_vector,
             limit=top_k,
+            search_params=SEARCH_PARAMS,
+            # Only the payload fields read below
+            with_payload=["text_chunk", "image_urls", "video_urls"],
+            with_vectors=False,
         )
     except Exception as exc:  # pragma: no cover - external service
         raise HTTPException(status_code=500, detail=f"Qdrant search failed: {exc}") from exc
 
     context_chunks: List[str] = []
-    image_urls: List[str] = []
-    video_urls: List[str] = []
+    # Media URLs in first-seen order, deduplicated as the hits are read
+    deduped_images: List[str] = []
+    deduped_videos: List[str] = []
+    seen_images = set()
+    seen_videos = set()
 
     for hit in search_result:
         payload = hit.payload or {}
         text_chunk = payload.get("text_chunk")
         if text_chunk:
             context_chunks.append(text_chunk)
-        image_urls.extend(payload.get("image_urls", []))
-        video_urls.extend(payload.get("video_urls", []))
-
-    deduped_images = list(dict.fromkeys(url for url in image_urls if url))
-    deduped_videos = list(dict.fromkeys(url for url in video_urls if url))
-
-    answer_text = generate_answer(context_chunks, question)
+        for url in payload.get("image_urls", ()):
+            if url and url not in seen_images:
+                seen_images.add(url)
+                deduped_images.append(url)
+        for url in payload.get("video_urls", ()):
+            if url and url not in seen_videos:
+                seen_videos.add(url)
+                deduped_videos.append(url)
+
+    answer_text = await asyncio.to_thread(generate_answer, context_chunks, question)
 
     return {
         "answer_text": answer_text,
@@ -0,0 +1,82 @@
+"""
+PDF text extraction and chunking.
+
+Kept free of clients and models (unlike main.py) so it can run in worker processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Union
+
+import pypdfium2 as pdfium
+
+# PDFs with at least this many pages are split across processes when extracting with workers > 1
+PARALLEL_MIN_PAGES = 64
+
+
+def _page_texts(source: Union[bytes, str, Path], start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop) of a PDF."""
+    pdf = pdfium.PdfDocument(source)
+    try:
+        texts = []
+        for index in range(start, stop):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            # PDFium marks soft hyphens at line breaks with U+FFFE
+            texts.append(textpage.get_text_range().replace("\ufffe", "-"))
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        pdf.close()
+
+
+def extract_text_from_pdf(source: Union[bytes, str, Path], workers: int = 1) -> str:
+    """
+    Extract raw text from a PDF (PDFium's C text layer, much faster than PyPDF2).
+    `source` is the file's bytes or its path; PDFium reads a path incrementally
+    instead of holding the whole file in memory. With workers > 1, a long PDF given
+    by path has its pages split into contiguous ranges extracted in parallel.
+    """
+    try:
+        pdf = pdfium.PdfDocument(source)
+        page_count = len(pdf)
+        pdf.close()
+
+        if workers > 1 and page_count >= PARALLEL_MIN_PAGES and not isinstance(source, bytes):
+            # PDFium isn't thread-safe, so each range goes to a process that opens the file itself
+            step = -(-page_count // workers)
+            starts = range(0, page_count, step)
+            stops = [min(start + step, page_count) for start in starts]
+            with ProcessPoolExecutor(max_workers=len(starts)) as executor:
+                ranges = executor.map(_page_texts, [source] * len(starts), starts, stops)
+                page_texts = [text for texts in ranges for text in texts]
+        else:
+            page_texts = _page_texts(source, 0, page_count)
+
+        return "\n\n".join(text for text in page_texts if text)
+    except Exception as exc:  # pragma: no cover - external dependency
+        raise ValueError(f"Failed to parse PDF: {exc}") from exc
+
+
+def chunk_text(text: str, max_words: int = 400, min_words: int = 5) -> List[str]:
+    """Turn raw text into ~max_words chunks, dropping any with fewer than min_words."""
+    words = text.split()
+    return [
+        " ".join(words[start:start + max_words])
+        for start in range(0, len(words), max_words)
+        if min(max_words, len(words) - start) >= min_words
+    ]
+
+
+def pdf_chunks(source: Union[bytes, str, Path], workers: int = 1) -> List[str]:
+    """Extract and chunk a PDF's text (from bytes or a path); raises ValueError if it has none."""
+    text = extract_text_from_pdf(source, workers)
+    if not text.strip():
+        raise ValueError("No text content found in PDF.")
+
+    text_chunks = chunk_text(text)
+    if not text_chunks:
+        raise ValueError("No valid chunks produced from PDF content.")
+
+    return text_chunks